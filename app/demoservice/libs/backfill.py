@@ -0,0 +1,184 @@
+import logging
+import time
+from django.conf import settings
+from demoservice.libs.demos import get_demo_url_pr
+from demoservice.libs.github_api import GitHubRateLimited, github_request
+from demoservice.libs.launchpad import get_demo_url
+from demoservice.models import Demo
+from demoservice.tasks.github import queue_start_demo
+from demoservice.tasks.launchpad import queue_start_launchpad_demo
+
+LAUNCHPAD_PREFIX = 'lp:'
+STARTING_STATUSES = [Demo.QUEUED, Demo.BUILDING]
+LIVE_STATUSES = [Demo.RUNNING, Demo.READY]
+
+
+def _github_get(session, path, params):
+    """GET through the shared token bucket, waiting out rate limits"""
+    while True:
+        try:
+            response = github_request(session, 'GET', path, params=params)
+        except GitHubRateLimited as e:
+            time.sleep(e.retry_after)
+            continue
+        response.raise_for_status()
+        return response
+
+
+def _list_open_github_prs(session, repo_path):
+    user, repo = repo_path.split('/')
+    page = 1
+    while True:
+        response = _github_get(
+            session,
+            '/repos/{user}/{repo}/pulls'.format(user=user, repo=repo),
+            {'state': 'open', 'per_page': 100, 'page': page},
+        )
+        for pull_request in response.json():
+            pr = str(pull_request['number'])
+            yield {
+                'demo_url': get_demo_url_pr(user, repo, pr),
+                'vcs_provider': Demo.GITHUB,
+                'user': user,
+                'repo': repo,
+                'pr': pr,
+                'sender': pull_request['user']['login'],
+                'head_sha': pull_request['head']['sha'],
+            }
+        if 'rel="next"' not in response.headers.get('Link', ''):
+            return
+        page += 1
+
+
+def _get_launchpad_head_sha(merge_proposal):
+    try:
+        ref = merge_proposal.source_git_repository.getRefByPath(
+            path=merge_proposal.source_git_path
+        )
+        return ref.commit_sha1
+    except Exception:
+        return ''
+
+
+def _list_open_launchpad_mps(lp, repo_path):
+    repository = lp.git_repositories.getByPath(path=repo_path)
+    # Landing candidates are the active merge proposals into the repository
+    for merge_proposal in repository.landing_candidates:
+        pr = merge_proposal.self_link.split('/')[-1]
+        yield {
+            'demo_url': get_demo_url(repository.name, pr),
+            'vcs_provider': Demo.LAUNCHPAD,
+            'user': '~' + merge_proposal.source_git_repository.owner.name,
+            'repo': repository.name,
+            'branch': merge_proposal.source_git_path.split('/')[-1],
+            'pr': pr,
+            'head_sha': _get_launchpad_head_sha(merge_proposal),
+        }
+
+
+def list_open_pull_requests(repos):
+    """Yield the open PRs and MPs of the given repositories.
+
+    GitHub repositories are given as "user/repo", Launchpad ones as
+    "lp:" followed by the repository path, ex: lp:~user/project/+git/repo
+    """
+    import requests
+    from launchpadlib.launchpad import Launchpad
+
+    logger = logging.getLogger(__name__)
+    session = requests.session()
+    lp = None
+    for repo_path in repos:
+        try:
+            if repo_path.startswith(LAUNCHPAD_PREFIX):
+                if lp is None:
+                    lp = Launchpad.login_anonymously(
+                        'demoservice', 'production'
+                    )
+                yield from _list_open_launchpad_mps(
+                    lp, repo_path[len(LAUNCHPAD_PREFIX):]
+                )
+            else:
+                yield from _list_open_github_prs(session, repo_path)
+        except Exception as e:
+            logger.error('Could not list open PRs of %s: %s', repo_path, e)
+
+
+def _is_up_to_date(demo, head_sha):
+    if demo.status in STARTING_STATUSES:
+        return True
+    if demo.status in LIVE_STATUSES:
+        return not head_sha or demo.head_sha == head_sha
+    return False
+
+
+def _queue_start(pull_request, verified_sha, countdown):
+    if pull_request['vcs_provider'] == Demo.LAUNCHPAD:
+        context = {
+            key: pull_request[key]
+            for key in ['demo_url', 'user', 'repo', 'branch', 'pr']
+        }
+        queue_start_launchpad_demo(
+            context=context,
+            countdown=countdown,
+            **context
+        )
+    else:
+        # The pull request author is verified like a webhook sender,
+        # unless the pull request is still on the commit the demo was
+        # built from
+        queue_start_demo(
+            github_user=pull_request['user'],
+            github_repo=pull_request['repo'],
+            github_pr=pull_request['pr'],
+            github_sender=pull_request['sender'],
+            github_verify_sender=True,
+            github_verified_sha=verified_sha,
+            countdown=countdown,
+        )
+
+
+def backfill_demos(repos=None, dry_run=False, progress=None):
+    """Start the demos of every open PR that isn't running its head commit.
+
+    Starts are queued in batches of DEMO_BACKFILL_BATCH_SIZE, each batch
+    DEMO_BACKFILL_BATCH_INTERVAL seconds after the previous one, so the
+    workers and Docker are not flooded. Returns the number of queued and
+    skipped demos.
+    """
+    from demoservice.libs.reconcile import sync_registry
+
+    if progress is None:
+        progress = logging.getLogger(__name__).info
+    if repos is None:
+        repos = settings.DEMO_BACKFILL_REPOS
+
+    # Demos whose containers disappeared must not count as running
+    if not dry_run:
+        sync_registry()
+    demos = {demo.url: demo for demo in Demo.objects.all()}
+
+    queued = 0
+    skipped = 0
+    for pull_request in list_open_pull_requests(repos):
+        demo = demos.get(pull_request['demo_url'])
+        if demo and _is_up_to_date(demo, pull_request['head_sha']):
+            skipped += 1
+            continue
+
+        batch = queued // settings.DEMO_BACKFILL_BATCH_SIZE
+        countdown = batch * settings.DEMO_BACKFILL_BATCH_INTERVAL
+        progress('Queueing {url} in {countdown}s'.format(
+            url=pull_request['demo_url'],
+            countdown=countdown,
+        ))
+        if not dry_run:
+            verified_sha = demo.head_sha if demo else None
+            _queue_start(pull_request, verified_sha, countdown)
+        queued += 1
+
+    progress('Queued {queued} demos, {skipped} already up to date'.format(
+        queued=queued,
+        skipped=skipped,
+    ))
+    return queued, skipped
@@ -0,0 +1,42 @@
+import hashlib
+import json
+from django.db import IntegrityError
+from demoservice.models import BlobFact
+
+
+def get_blob_sha(path):
+    """The git blob SHA of a file, as git hash-object would give it"""
+    with open(path, 'rb') as blob:
+        contents = blob.read()
+    sha = hashlib.sha1()
+    sha.update('blob {}\0'.format(len(contents)).encode('utf-8'))
+    sha.update(contents)
+    return sha.hexdigest()
+
+
+def get_blob_fact(repo, path, name, compute):
+    """Return compute(path), cached per repository and blob SHA of path.
+
+    The value has to be JSON serialisable.
+    """
+    blob_sha = get_blob_sha(path)
+    fact = BlobFact.objects.filter(
+        repo=repo,
+        blob_sha=blob_sha,
+        name=name,
+    ).first()
+    if fact:
+        return json.loads(fact.value)
+
+    value = compute(path)
+    try:
+        BlobFact.objects.create(
+            repo=repo,
+            blob_sha=blob_sha,
+            name=name,
+            value=json.dumps(value),
+        )
+    except IntegrityError:
+        # Another worker worked it out at the same time
+        pass
+    return value
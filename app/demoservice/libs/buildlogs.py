@@ -0,0 +1,147 @@
+import os
+import signal
+import threading
+import time
+from subprocess import PIPE, STDOUT, Popen, TimeoutExpired
+from django.conf import settings
+from django.db import connection
+
+
+def get_build_log_path(demo_url):
+    return os.path.join(settings.DEMO_LOG_DIR, demo_url + '.log')
+
+
+def _read_from(path, offset=0):
+    try:
+        with open(path, 'rb') as log_file:
+            log_file.seek(offset)
+            return log_file.read()
+    except FileNotFoundError:
+        return b''
+
+
+def _get_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _kill_process_group(p):
+    """Terminate a command and everything it started"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(p.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            p.wait(timeout=settings.DEMO_STOP_TIMEOUT)
+            return
+        except TimeoutExpired:
+            pass
+
+
+class BuildLog:
+    """Output of the build steps of a single demo.
+
+    The log is rotated into one backup file when it grows over half of
+    DEMO_BUILD_LOG_MAX_BYTES, so a demo never takes up more than that.
+    With is_cancelled, commands are killed as soon as it returns true.
+    after_run is called once each command has finished.
+    """
+
+    def __init__(self, demo_url, is_cancelled=None, after_run=None):
+        self.path = get_build_log_path(demo_url)
+        self.is_cancelled = is_cancelled
+        self.after_run = after_run
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def reset(self):
+        for path in (self.path, self.path + '.1'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def write(self, text):
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        with open(self.path, 'ab') as log_file:
+            log_file.write(text)
+            size = log_file.tell()
+        if size > settings.DEMO_BUILD_LOG_MAX_BYTES // 2:
+            os.replace(self.path, self.path + '.1')
+
+    def run(self, args, **kwargs):
+        """Run a command with its output going to the log.
+
+        Returns the exit code of the command.
+        """
+        self.write('$ {}\n'.format(' '.join(args)))
+        # A session of its own lets a cancel kill the whole process group
+        p = Popen(
+            args,
+            stdout=PIPE,
+            stderr=STDOUT,
+            start_new_session=True,
+            **kwargs
+        )
+        if self.is_cancelled:
+            threading.Thread(
+                target=self._watch,
+                args=(p,),
+                name='build-log-watch',
+                daemon=True,
+            ).start()
+        for line in p.stdout:
+            self.write(line)
+        return_code = p.wait()
+        if self.after_run:
+            self.after_run()
+        return return_code
+
+    def _watch(self, p):
+        try:
+            while p.poll() is None:
+                if self.is_cancelled():
+                    self.write('Cancelled, stopping the command\n')
+                    _kill_process_group(p)
+                    return
+                time.sleep(settings.DEMO_CANCEL_POLL_INTERVAL)
+        finally:
+            # Django opens a database connection per thread
+            connection.close()
+
+
+def tail_build_log(demo_url, max_bytes):
+    """The end of a build log and the offset to follow it from"""
+    path = get_build_log_path(demo_url)
+    current = _read_from(path)
+    previous = b''
+    if len(current) < max_bytes:
+        previous = _read_from(path + '.1')
+    return (previous + current)[-max_bytes:], len(current)
+
+
+def follow_build_log(demo_url, offset, is_building, max_age):
+    """Yield what gets written to a build log after offset.
+
+    Stops once is_building() is false and the log has been read to the end,
+    or after max_age seconds.
+    """
+    path = get_build_log_path(demo_url)
+    started = time.monotonic()
+    while time.monotonic() - started < max_age:
+        building = is_building()
+        size = _get_size(path)
+        if size < offset:
+            # The log was rotated, finish the backup before starting over
+            yield _read_from(path + '.1', offset)
+            offset = 0
+        if size > offset:
+            data = _read_from(path, offset)
+            offset += len(data)
+            yield data
+        elif not building:
+            return
+        time.sleep(1)
@@ -1,43 +1,82 @@
-import fileinput
-import json
 import logging
 import os
-import re
-import urllib
-import docker
-import requests
-import shutil
-import socket
-import yaml
+import urllib.request
 from distutils.version import StrictVersion
 from subprocess import Popen, check_output
 from django.conf import settings
-from github3 import login
-from github3.models import GitHubError
-from launchpadlib.launchpad import Launchpad
+from demoservice.libs.blobfacts import get_blob_fact
+from demoservice.libs.buildlogs import BuildLog
+from demoservice.libs.depcache import get_cache_docker_options
+from demoservice.libs.diskusage import forget_demo, measure_demo
+from demoservice.libs.images import (
+    get_cached_image,
+    get_source_hash,
+    store_image,
+)
+from demoservice.libs.nodes import (
+    get_demo_node,
+    get_docker_client,
+    get_docker_env,
+    reserve_port,
+)
+from demoservice.libs.registry import (
+    DemoCancelled,
+    is_demo_cancelled,
+    set_demo_status,
+)
+from demoservice.libs.snapshots import snapshot_demo
+from demoservice.libs.trash import move_to_trash, remove_tree_throttled
+from demoservice.libs.worktrees import create_worktree, stage_worktree
 from demoservice.logging import get_demo_logger
+from demoservice.models import Demo
 
 MIN_RUNSCRIPT_VERSION = '2.0.0'
+JEKYLL_CONFIG_NAMES = ['_config.yml', '_config.yaml']
 DEMO_PR_URL_TEMPLATE = '{repo_name}-{org_name}-pr-{github_pr}.run.demo.haus'
 GITHUB_CLONE_URL = 'https://github.com/{github_user}/{github_repo}.git'
+# Above the catch-all route to the placeholder of lazy demos
+TRAEFIK_DEMO_PRIORITY = '10'
 
 
-def _get_open_port():
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(('', 0))
-    s.listen(1)
-    port = s.getsockname()[1]
-    s.close()
-    return port
+def get_published_ports(container):
+    """Host ports a running container publishes"""
+    ports = set()
+    bindings = container.attrs['NetworkSettings']['Ports'] or {}
+    for port_bindings in bindings.values():
+        for binding in port_bindings or []:
+            if binding.get('HostPort'):
+                ports.add(int(binding['HostPort']))
+    return ports
+
+
+def _reserve_port(demo_url, node):
+    """Reserve a port on the demo's node for ./run.
+
+    ./run needs the port before it starts the containers, so it can't be
+    left to Docker.
+    """
+    published_ports = set()
+    for container in get_docker_client(node).containers.list():
+        published_ports |= get_published_ports(container)
+    return reserve_port(demo_url, node, published_ports)
+
+
+# github3, launchpadlib, yaml and requests are only needed by the Celery
+# workers, so they are imported where they are used. This module is also
+# imported by the web processes through the task modules.
 
 
 def _is_github_repo_collaborator(repo_owner, repo_name, user):
+    from github3 import login
+
     gh = login('-', password=settings.GITHUB_TOKEN)
     repo = gh.repository(repo_owner, repo_name)
     return repo.is_collaborator(user)
 
 
 def _is_launchpad_team_member(team_name, person_name):
+    from launchpadlib.launchpad import Launchpad
+
     lp = Launchpad.login_anonymously('demoservice', 'production')
     try:
         team = lp.people[team_name]
@@ -87,47 +126,152 @@ def notify_github_pr(
     else:
         logger = logging.getLogger(__name__)
 
-    comment = {
-        'body': message,
-    }
-
-    api_url = (
-        'https://api.github.com'
-        '/repos/{github_user}/{github_repo}/'
-        'issues/{github_pr}/comments'
-    ).format(
-        github_user=github_user,
-        github_repo=github_repo,
-        github_pr=github_pr,
-    )
-
-    logger.debug('GitHub comment API URL: %s', api_url)
-    logger.info('Commenting on pull request: %s', comment['body'])
+    logger.info('Commenting on pull request: %s', message)
 
     github_token = settings.GITHUB_TOKEN
     if not github_token:
         logger.warning('Missing GITHUB_TOKEN environment variable')
         return None
 
-    api_headers = {
-        'Authorization': 'token {token}'.format(token=github_token)
-    }
-
     if settings.DEBUG:
         logger.debug('Simulating GitHub notification while DEBUG is active')
         return True
 
-    session = requests.session()
-    request = session.post(api_url, json.dumps(comment), headers=api_headers)
-    if request.status_code == 201:
-        logger.info('Successfully notified Pull Request')
-    else:
-        logger.warning('Could not notify Pull Request: %s', request.content)
-        raise Exception(
-            'Failed to notify Github: {content}'.format(
-                content=request.content
-            )
+    from demoservice.libs.github_api import upsert_pr_comment
+
+    upsert_pr_comment(
+        message=message,
+        github_user=github_user,
+        github_repo=github_repo,
+        github_pr=github_pr,
+    )
+    logger.info('Successfully notified Pull Request')
+    return True
+
+
+def _check_cancelled(demo_url):
+    """Abort a start between steps if the demo has been stopped"""
+    if is_demo_cancelled(demo_url):
+        raise DemoCancelled('Start of {} was cancelled'.format(demo_url))
+
+
+def _get_run_script_version(run_command_path):
+    return (
+        check_output(
+            ['./run', '--version'],
+            cwd=os.path.dirname(run_command_path),
         )
+        .decode('utf-8')
+        .rstrip()
+        .split('@')[-1]
+    )
+
+
+def _get_jekyll_baseurl(jekyll_config_path):
+    import yaml
+
+    logger = logging.getLogger(__name__)
+    with open(jekyll_config_path, 'r') as stream:
+        try:
+            jekyll_config = yaml.safe_load(stream) or {}
+        except yaml.YAMLError as e:
+            logger.error('Error parsing Jekyll config YAML: %s', e)
+            return ''
+    return str(jekyll_config.get('baseurl') or '').strip('/')
+
+
+def _get_head_sha(local_path):
+    return (
+        check_output(['git', 'rev-parse', 'HEAD'], cwd=local_path)
+        .decode('utf-8')
+        .strip()
+    )
+
+
+def _verify_github_sender(github_user, github_repo, github_sender, logger):
+    """None if the sender may start demos of the repo, or why they can't"""
+    from github3 import login
+    from github3.models import GitHubError
+
+    logger.debug(
+        'Verifying %s is a collaborator of %s/%s',
+        github_sender,
+        github_user,
+        github_repo,
+    )
+    try:
+        if not _is_github_repo_collaborator(
+            github_user,
+            github_repo,
+            github_sender
+        ):
+            logger.info(
+                "%s is not a collaborator of this repo", github_sender
+            )
+            return (
+                "User is not a collaborator of this repo. "
+                "Please start demo manually."
+            )
+    except GitHubError as ge:
+        # If user does not have permission to check repo collaborators
+        # an exception with the 403 code is expected.
+        if 403 == ge.code:
+            gh = login('-', password=settings.GITHUB_TOKEN)
+            bot = gh.user().login
+            return (
+                "User {bot} does not have enough permissions "
+                "to perform necessary checks. "
+                "Please review user permissions for this repository."
+            ).format(bot=bot)
+        return "There was a GitHub API error."
+
+    logger.info('User is a collaborator of the repo')
+    return None
+
+
+def _is_verified_commit(github_verified_sha, head_sha):
+    """Whether the checkout is the commit a sender was verified for"""
+    return bool(github_verified_sha) and head_sha == github_verified_sha
+
+
+def _pull_github_pr(local_path, github_pr, logger, build_log):
+    if not github_pr:
+        return True
+
+    logger.info('Pulling PR branch for %s', github_pr)
+    return_code = build_log.run(
+        ['git', 'pr', str(github_pr)],
+        cwd=local_path,
+    )
+    if return_code > 0:
+        logger.error('Error while pulling PR %s branch', github_pr)
+        return False
+    return True
+
+
+def _fetch_github_pr(clone_url, local_path, github_pr, logger, build_log):
+    """Clone a repository and check out a PR, without running any of it"""
+    if not create_worktree(clone_url, local_path, logger, build_log):
+        logger.error('Error while cloning %s', clone_url)
+        return False
+    return _pull_github_pr(local_path, github_pr, logger, build_log)
+
+
+def _fetch_launchpad_branch(clone_url, local_path, branch, logger, build_log):
+    """Clone a repository and check out a branch, without running any of it"""
+    if not create_worktree(clone_url, local_path, logger, build_log):
+        logger.error("Error while cloning %s", clone_url)
+        return False
+
+    logger.info("Checking out feature branch %s", branch)
+    return_code = build_log.run(
+        ["git", "checkout", branch],
+        cwd=local_path,
+    )
+    if return_code > 0:
+        logger.error("Error while checkint out branch: %s", branch)
+        return False
+    return True
 
 
 def start_demo(
@@ -137,53 +281,44 @@ def start_demo(
     github_pr,
     github_sender=None,
     github_verify_sender=True,
+    github_verified_sha=None,
     context=None,
 ):
+    """Fetch a pull request and start its demo with ./run serve.
+
+    With github_verified_sha, the sender is only verified if the pull
+    request moved on from that commit, once it has been fetched.
+    """
     if context:
         logger = get_demo_logger(__name__, **context)
     else:
         logger = logging.getLogger(__name__)
 
-    if github_verify_sender:
-        logger.debug('Verifying if user is collaborator of repo',)
-        if not github_sender:
-            logger.error('GitHub webhook sender is not set for verification')
+    if github_verify_sender and not github_sender:
+        logger.error('GitHub webhook sender is not set for verification')
+        return None
+
+    def authorize():
+        if not github_verify_sender or github_verified_sha:
             return None
-        logger.debug(
-            'Verifying %s is a collaborator of %s/%s',
-            github_sender,
+        return _verify_github_sender(
             github_user,
             github_repo,
+            github_sender,
+            logger,
         )
-        try:
-            if not _is_github_repo_collaborator(
-                github_user,
-                github_repo,
-                github_sender
-            ):
-                logger.info(
-                    "%s is not a collaborator of this repo", github_sender
-                )
-                return (
-                    "User is not a collaborator of this repo. "
-                    "Please start demo manually."
-                )
-        except GitHubError as ge:
-            # If user does not have permission to check repo collaborators
-            # an exception with the 403 code is expected.
-            if 403 == ge.code:
-                gh = login('-', password=settings.GITHUB_TOKEN)
-                bot = gh.user().login
-                return (
-                    "User {bot} does not have enough permissions "
-                    "to perform necessary checks. "
-                    "Please review user permissions for this repository."
-                ).format(bot=bot)
-            return "There was a GitHub API error."
-
-        logger.info('User is a collaborator of the repo')
 
     logger.info('Preparing demo: %s', demo_url)
+    # The checkout is measured after every step, as the build fills it
+    build_log = BuildLog(
+        demo_url,
+        is_cancelled=lambda: is_demo_cancelled(demo_url),
+        after_run=lambda: measure_demo(demo_url),
+    )
+    build_log.reset()
+
+    node = get_demo_node(demo_url)
+    run_env = get_docker_env(os.environ, node)
 
     os.makedirs(settings.DEMO_DIR, exist_ok=True)
     local_path = os.path.join(settings.DEMO_DIR, demo_url)
@@ -195,46 +330,70 @@ def start_demo(
             github_user=github_user,
             github_repo=github_repo,
         )
-        logger.info('Cloning git repo: %s', clone_url)
-        p = Popen(['git', 'clone', clone_url, local_path])
-        return_code = p.wait()
-        if return_code > 0:
-            logger.error('Error while cloning %s', clone_url)
-            return False
-    elif os.path.exists(run_command_path):
-        logger.info('Cleaning previous run script')
-        p = Popen(
-            ['./run', 'clean'],
-            cwd=local_path,
+        reason, fetched = stage_worktree(
+            lambda path: _fetch_github_pr(
+                clone_url,
+                path,
+                github_pr,
+                logger,
+                build_log,
+            ),
+            authorize,
+            local_path,
+            logger,
         )
-        p.wait()
-
-    if github_pr:
-        logger.info('Pulling PR branch for %s', github_pr)
-        p = Popen(
-            ['git', 'pr', str(github_pr)],
-            cwd=local_path,
-        )
-        return_code = p.wait()
-        if return_code > 0:
-            logger.error('Error while pulling PR %s branch', github_pr)
+        if reason:
+            return reason
+        _check_cancelled(demo_url)
+        if not fetched:
+            return False
+    else:
+        reason = authorize()
+        if reason:
+            return reason
+        if os.path.exists(run_command_path):
+            logger.info('Cleaning previous run script')
+            build_log.run(['./run', 'clean'], cwd=local_path, env=run_env)
+            _check_cancelled(demo_url)
+        pulled = _pull_github_pr(local_path, github_pr, logger, build_log)
+        _check_cancelled(demo_url)
+        if not pulled:
             return False
 
-    p = Popen(['git', 'reset', '--hard', 'HEAD'], cwd=local_path)
-    p.wait()
+    build_log.run(['git', 'reset', '--hard', 'HEAD'], cwd=local_path)
+    head_sha = _get_head_sha(local_path)
+
+    # Commits pushed since the verified one may come from anybody, they
+    # are checked before anything in the checkout runs
+    if github_verify_sender and github_verified_sha and not (
+        _is_verified_commit(github_verified_sha, head_sha)
+    ):
+        reason = _verify_github_sender(
+            github_user,
+            github_repo,
+            github_sender,
+            logger,
+        )
+        if reason:
+            return reason
 
     # Check for the run command to continue
     if not os.path.exists(run_command_path):
         message = 'No ./run found. Unable to start demo.'
         logger.info(message)
+        build_log.write(message + '\n')
         return message
 
+    # Things worked out from files in the checkout are cached by blob SHA,
+    # so repeat starts of the same commit skip the work
+    repo_name = '/'.join([github_user, github_repo])
+
     # Check the project has the minimum required version of ./run
-    run_script_version = (
-        check_output(["./run", "--version"], cwd=local_path)
-        .decode("utf-8")
-        .rstrip()
-        .split("@")[-1]
+    run_script_version = get_blob_fact(
+        repo_name,
+        run_command_path,
+        'run_script_version',
+        _get_run_script_version,
     )
 
     if StrictVersion(run_script_version) < StrictVersion(MIN_RUNSCRIPT_VERSION):
@@ -243,16 +402,22 @@ def start_demo(
             "version of ./run script is {}"
         ).format(MIN_RUNSCRIPT_VERSION)
         logger.info(message)
+        build_log.write(message + '\n')
         return message
 
     # Stop bower complaining about running as root...
     # This actually updates the run command for now and resets on rerun
-    run_file_contents = open(run_command_path).read()
+    with open(run_command_path) as run_file:
+        run_file_contents = run_file.read()
     bower_string = 'bower install'
     bower_string_for_root = 'bower install --allow-root'
     if bower_string_for_root not in run_file_contents:
-        for line in fileinput.input(run_command_path, inplace=True):
-            print(line.replace(bower_string, bower_string_for_root), end='')
+        patched_contents = run_file_contents.replace(
+            bower_string, bower_string_for_root
+        )
+        if patched_contents != run_file_contents:
+            with open(run_command_path, 'w') as run_file:
+                run_file.write(patched_contents)
 
     # Set the docker name if not created
     docker_project_path = os.path.join(local_path, '.docker-project')
@@ -263,37 +428,33 @@ def start_demo(
     demo_url_path = ''
 
     # Check for Jekyll base paths
-    jekyll_config_name = r'^_config\.ya?ml$'
-    jekyll_config_path = False
-    for _file in os.listdir(local_path):
-        # if fnmatch.fnmatch(_file, jekyll_config_name):
-        if re.search(jekyll_config_name, _file):
-            jekyll_config_path = os.path.join(local_path, _file)
+    for config_name in JEKYLL_CONFIG_NAMES:
+        jekyll_config_path = os.path.join(local_path, config_name)
+        if os.path.isfile(jekyll_config_path):
+            logger.info('Found Jekyll config, looking for baseurl')
+            demo_url_path = get_blob_fact(
+                repo_name,
+                jekyll_config_path,
+                'jekyll_baseurl',
+                _get_jekyll_baseurl,
+            )
+            logger.info('Setting demo path to %s', demo_url_path)
             break
 
-    if jekyll_config_path:
-        logger.info('Found Jekyll config, looking for baseurl')
-        with open(jekyll_config_path, 'r') as stream:
-            try:
-                jekyll_config = yaml.load(stream)
-            except yaml.YAMLError as e:
-                logger.error('Error parsing Jekyll config YAML: %s', e)
-        demo_url_path = jekyll_config.get('baseurl', '').strip('/')
-        logger.info('Setting demo path to %s', demo_url_path)
-
     # Start ./run server with extra options
     demo_url_full = ''.join(['https://', demo_url, '/'])
     if demo_url_path:
         demo_url_full = ''.join([demo_url_full, demo_url_path, '/'])
     logger.info('Starting demo: %s', demo_url_full)
 
-    port = _get_open_port()
+    port = _reserve_port(demo_url, node)
 
     docker_options = ''
     docker_labels = {
         'traefik.enable': 'true',
         'traefik.frontend.rule': 'Host:{url}'.format(url=demo_url),
         'traefik.port': port,
+        'traefik.frontend.priority': TRAEFIK_DEMO_PRIORITY,
         'run.demo': True,
         'run.demo.url': demo_url,
         'run.demo.url_full': demo_url_full,
@@ -314,50 +475,123 @@ def start_demo(
     for key, value in docker_env_opts.items():
         docker_options += " -e {key}={value}".format(key=key[9:], value=value)
 
-    run_env = os.environ.copy()
+    # Share package manager caches between demos with the same lockfiles
+    docker_options += get_cache_docker_options(local_path)
+
     run_env["CANONICAL_WEBTEAM_RUN_SERVE_DOCKER_OPTS"] = docker_options
     serve_args = ''
     if 'tutorials' in github_repo:
         serve_args = './tutorials/*/'
-    p = Popen(
+    return_code = build_log.run(
         ['./run', 'serve', '--detach', '--port', str(port), serve_args],
         cwd=local_path,
         env=run_env,
     )
-    return_code = p.wait()
+    if is_demo_cancelled(demo_url):
+        # The stop may have run before these containers existed
+        _stop_demo_containers(demo_url, logger)
+        _check_cancelled(demo_url)
     if return_code > 0:
         raise Exception('Error starting ./run')
 
+    set_demo_status(
+        demo_url,
+        Demo.RUNNING,
+        from_status=Demo.BUILDING,
+        port=port,
+        url_full=demo_url_full,
+        head_sha=head_sha,
+    )
+    snapshot_demo(demo_url)
     message = 'Starting demo at: {demo_url}'.format(demo_url=demo_url_full)
     return message
 
 
+def _stop_demo_containers(demo_url, logger):
+    client = get_docker_client(get_demo_node(demo_url))
+    containers = client.containers.list(
+        filters={
+            'label': 'run.demo.url={url}'.format(url=demo_url),
+        }
+    )
+    for container in containers:
+        logger.info('Stopping container %s', container.name)
+        container.stop(timeout=settings.DEMO_STOP_TIMEOUT)
+
+
 def stop_demo(
     demo_url,
     context=None,
 ):
+    """Take a demo offline and move its files out of the way.
+
+    Stopping the containers removes the demo from Traefik and the dashboard
+    straight away. The checkout is renamed into the trash area and the path
+    is returned so reclaim_demo can clean it up in the background.
+    """
     if context:
         logger = get_demo_logger(__name__, **context)
     else:
         logger = logging.getLogger(__name__)
     logger.info('Stopping demo: %s', demo_url)
 
+    # Tells the watchdog not to bring the containers back
+    set_demo_status(demo_url, Demo.STOPPING)
+    _stop_demo_containers(demo_url, logger)
+    set_demo_status(demo_url, Demo.STOPPED)
+
     local_path = os.path.join(settings.DEMO_DIR, demo_url)
     if not os.path.isdir(local_path):
         return False
 
+    logger.info('Moving files for %s to trash', demo_url)
+    trash_path = move_to_trash(local_path)
+    forget_demo(demo_url)
+    return trash_path
+
+
+def reclaim_demo(
+    trash_path,
+    demo_url=None,
+    context=None,
+):
+    if context:
+        logger = get_demo_logger(__name__, **context)
+    else:
+        logger = logging.getLogger(__name__)
+
+    if not trash_path or not os.path.isdir(trash_path):
+        return False
+
     # Check for the run command to clean
-    run_command_path = os.path.join(local_path, 'run')
+    run_command_path = os.path.join(trash_path, 'run')
     if os.path.exists(run_command_path):
         logger.info('Running clean command')
         p = Popen(
             ['./run', 'clean'],
-            cwd=local_path,
+            cwd=trash_path,
+            env=get_docker_env(os.environ, get_demo_node(demo_url)),
         )
         p.wait()
 
-    logger.info('Deleting files for %s', demo_url)
-    shutil.rmtree(local_path)
+    logger.info('Deleting files in %s', trash_path)
+    remove_tree_throttled(trash_path)
+    return True
+
+
+def _build_image(client, local_path, tag, build_log):
+    # The low level API streams the build output as it happens
+    build_log.write("$ docker build -t {} .\n".format(tag))
+    for chunk in client.api.build(
+        path=local_path,
+        tag=tag,
+        rm=True,
+        decode=True,
+    ):
+        if "stream" in chunk:
+            build_log.write(chunk["stream"])
+        if "error" in chunk:
+            raise Exception(chunk["error"])
 
 
 def start_launchpad_demo(
@@ -370,26 +604,32 @@ def start_launchpad_demo(
 ):
     logger = logging.getLogger(__name__)
 
-    # Check is the user is member of any of the allowed teams
-    logger.info('Verifying if user is in allowed teams')
-    team_member = False
-    for team in settings.LAUNCHPAD_ALLOWED_TEAMS:
-        if _is_launchpad_team_member(team, user):
-            team_member = True
-            break
+    def authorize():
+        # Check is the user is member of any of the allowed teams
+        logger.info('Verifying if user is in allowed teams')
+        for team in settings.LAUNCHPAD_ALLOWED_TEAMS:
+            if _is_launchpad_team_member(team, user):
+                return None
 
-    if not team_member:
         logger.error(
             "User is not a member of any of the allowed teams (%s)",
             settings.LAUNCHPAD_ALLOWED_TEAMS
         )
-        return False
+        return "User is not a member of any of the allowed teams"
 
     os.makedirs(settings.DEMO_DIR, exist_ok=True)
     local_path = os.path.join(settings.DEMO_DIR, demo_url)
+    # The checkout is measured after every step, as the build fills it
+    build_log = BuildLog(
+        demo_url,
+        is_cancelled=lambda: is_demo_cancelled(demo_url),
+        after_run=lambda: measure_demo(demo_url),
+    )
+    build_log.reset()
 
     # Create docker client
-    client = docker.from_env()
+    node = get_demo_node(demo_url)
+    client = get_docker_client(node)
 
     # Clone or update branch
     if not os.path.isdir(local_path):
@@ -398,19 +638,25 @@ def start_launchpad_demo(
             repo=repo,
         )
 
-        logger.info("Cloning git repo: %s", clone_url)
-        p = Popen(["git", "clone", clone_url, local_path])
-        return_code = p.wait()
-        if return_code > 0:
-            logger.error("Error while cloning %s", clone_url)
-            return False
-        logger.info("Checking out feature branch %s", branch)
-        p = Popen(["git", "checkout", branch], cwd=local_path)
-        return_code = p.wait()
-        if return_code > 0:
-            logger.error("Error while checkint out branch: %s", branch)
+        reason, fetched = stage_worktree(
+            lambda path: _fetch_launchpad_branch(
+                clone_url,
+                path,
+                branch,
+                logger,
+                build_log,
+            ),
+            authorize,
+            local_path,
+            logger,
+        )
+        _check_cancelled(demo_url)
+        if reason or not fetched:
             return False
     else:
+        if authorize():
+            return False
+
         # Docker cleanup
         logger.info("Running docker cleanup")
         try:
@@ -423,8 +669,8 @@ def start_launchpad_demo(
 
         # Pull latest changes on source branch
         logger.info("Pulling latest changes for branch: %s", branch)
-        p = Popen(["git", "pull"], cwd=local_path)
-        return_code = p.wait()
+        return_code = build_log.run(["git", "pull"], cwd=local_path)
+        _check_cancelled(demo_url)
         if return_code > 0:
             logger.error(
                 "Error while fetching latest changes for branch: %s",
@@ -432,10 +678,10 @@ def start_launchpad_demo(
             )
             return False
 
+    head_sha = _get_head_sha(local_path)
+
     # Docker build
-    logger.info("Building image %s", demo_url)
     try:
-        docker_file = None
         docker_file_path = "{}/Dockerfile".format(local_path)
         if not os.path.exists(docker_file_path):
             url = settings.DOCKERFILE_REPO_TEMPLATE.format(
@@ -447,27 +693,32 @@ def start_launchpad_demo(
             data = response.read().decode("utf-8")
             open(docker_file_path, "w").write(data)
 
-        client.images.build(
-            path=local_path,
-            tag=demo_url,
-            rm=True,
-        )
+        source_hash = get_source_hash(local_path, docker_file_path)
+        cached_tag = get_cached_image(client, node, repo, source_hash)
+        if cached_tag:
+            logger.info("Reusing image %s", cached_tag)
+            build_log.write("Reusing image {}\n".format(cached_tag))
+            client.images.get(cached_tag).tag(demo_url)
+        else:
+            logger.info("Building image %s", demo_url)
+            _build_image(client, local_path, demo_url, build_log)
+            store_image(client, node, repo, source_hash, demo_url)
     except Exception as e:
         logger.info("Error building image: %s", e)
+        build_log.write("Error building image: {}\n".format(e))
         return False
+    _check_cancelled(demo_url)
 
     # Docker start
     logger.info("Starting container %s", demo_url)
 
-    # TODO: Make port allocation dynamic
-    # For now expose 5240 if maas or 80 if any other project
+    # Expose 5240 if maas or 80 if any other project, the engine of the
+    # node picks the host port
     container_port = 80
-    host_port = _get_open_port()
-
     if repo == "maas":
         container_port = 5240
 
-    ports = {container_port: host_port}
+    ports = {container_port: None}
 
     # TODO: Fix views  and templates so we don't have to start
     # launchpad demos with github prefixed labels.
@@ -475,6 +726,7 @@ def start_launchpad_demo(
         "traefik.enable": "true",
         "traefik.frontend.rule": "Host:{url}".format(url=demo_url),
         "traefik.port": str(container_port),
+        "traefik.frontend.priority": TRAEFIK_DEMO_PRIORITY,
         "run.demo": "True",
         "run.demo.url": demo_url,
         "run.demo.url_full": "http://{}".format(demo_url),
@@ -485,17 +737,36 @@ def start_launchpad_demo(
     }
 
     try:
-        client.containers.run(
+        container = client.containers.run(
             demo_url,
             name=demo_url,
             ports=ports,
             labels=docker_labels,
             detach=True
         )
+        container.reload()
+        host_port = min(get_published_ports(container))
     except Exception as e:
         logger.info("Error starting the container %s", e)
+        build_log.write("Error starting the container: {}\n".format(e))
         return False
 
+    if is_demo_cancelled(demo_url):
+        # The stop may have run before this container existed
+        container = client.containers.get(demo_url)
+        container.stop(timeout=settings.DEMO_STOP_TIMEOUT)
+        container.remove(v=True)
+        _check_cancelled(demo_url)
+
+    set_demo_status(
+        demo_url,
+        Demo.RUNNING,
+        from_status=Demo.BUILDING,
+        port=host_port,
+        url_full=docker_labels["run.demo.url_full"],
+        head_sha=head_sha,
+    )
+    snapshot_demo(demo_url)
     message = "Starting demo at: {demo_url}".format(demo_url=demo_url)
     logger.info(message)
     return message
@@ -505,24 +776,57 @@ def stop_launchpad_demo(
     demo_url,
     context=None
 ):
+    """Stop and remove the demo container, leaving the rest for later.
+
+    Returns the trash path of the checkout so reclaim_launchpad_demo can
+    remove the image and the files in the background.
+    """
+    from docker.errors import NotFound
+
     logger = logging.getLogger(__name__)
     logger.info("Stopping demo: %s", demo_url)
 
+    # Tells the watchdog not to bring the container back
+    set_demo_status(demo_url, Demo.STOPPING)
+
     # Create docker client
-    client = docker.from_env()
+    client = get_docker_client(get_demo_node(demo_url))
     try:
         container = client.containers.get(demo_url)
-        container.stop()
+        container.stop(timeout=settings.DEMO_STOP_TIMEOUT)
         container.remove(v=True)
+    except NotFound:
+        # Crashed and removed, or never started
+        logger.info("No container left for %s", demo_url)
+    set_demo_status(demo_url, Demo.STOPPED)
+
+    local_path = os.path.join(settings.DEMO_DIR, demo_url)
+    if not os.path.isdir(local_path):
+        return False
+
+    logger.info("Moving files for %s to trash", demo_url)
+    trash_path = move_to_trash(local_path)
+    forget_demo(demo_url)
+    return trash_path
+
+
+def reclaim_launchpad_demo(
+    trash_path,
+    demo_url,
+    context=None
+):
+    logger = logging.getLogger(__name__)
+
+    client = get_docker_client(get_demo_node(demo_url))
+    try:
         client.images.remove(image=demo_url)
     except Exception as e:
         logger.error(e)
-        return False
 
-    local_path = os.path.join(settings.DEMO_DIR, demo_url)
-    if not os.path.isdir(local_path):
+    if not trash_path or not os.path.isdir(trash_path):
         return False
 
-    logger.info("Deleting files for %s", demo_url)
-    shutil.rmtree(local_path)
+    logger.info("Deleting files in %s", trash_path)
+    remove_tree_throttled(trash_path)
     logger.info("Demo %s removed.", demo_url)
+    return True
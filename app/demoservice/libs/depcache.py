@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import time
+from django.conf import settings
+from demoservice.libs.trash import move_to_trash, remove_tree_throttled
+
+# Each package manager gets a cache directory per lockfile hash. The
+# directory is mounted into the ./run containers and the package manager is
+# pointed at it through its cache environment variable.
+PACKAGE_MANAGERS = {
+    'yarn': {
+        'lockfiles': ['yarn.lock'],
+        'env': 'YARN_CACHE_FOLDER',
+    },
+    'npm': {
+        'lockfiles': ['package-lock.json'],
+        'env': 'npm_config_cache',
+    },
+    'pip': {
+        'lockfiles': ['requirements.txt'],
+        'env': 'PIP_CACHE_DIR',
+    },
+    'bower': {
+        'lockfiles': ['bower.json'],
+        'env': 'bower_storage__packages',
+    },
+}
+CONTAINER_CACHE_PATH = '/var/cache/demoservice/{manager}'
+
+
+def _hash_lockfiles(local_path, lockfiles):
+    sha = hashlib.sha256()
+    found = False
+    for lockfile in lockfiles:
+        path = os.path.join(local_path, lockfile)
+        if os.path.isfile(path):
+            found = True
+            with open(path, 'rb') as lockfile_contents:
+                sha.update(lockfile_contents.read())
+    if not found:
+        return None
+    return sha.hexdigest()[:16]
+
+
+def get_cache_docker_options(local_path):
+    """Docker options mounting the dependency caches matching a checkout"""
+    logger = logging.getLogger(__name__)
+    options = ''
+    for manager, config in sorted(PACKAGE_MANAGERS.items()):
+        key = _hash_lockfiles(local_path, config['lockfiles'])
+        if not key:
+            continue
+
+        cache_path = os.path.join(settings.DEMO_CACHE_DIR, manager, key)
+        os.makedirs(cache_path, exist_ok=True)
+        # The modification time is what eviction uses to find the LRU entry
+        os.utime(cache_path)
+        logger.debug('Using %s cache %s', manager, key)
+
+        container_path = CONTAINER_CACHE_PATH.format(manager=manager)
+        options += ' -v {host}:{container}'.format(
+            host=cache_path,
+            container=container_path,
+        )
+        options += ' -e {env}={container}'.format(
+            env=config['env'],
+            container=container_path,
+        )
+    return options
+
+
+def _get_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def evict_caches(max_bytes=None):
+    """Remove the least recently used caches until they fit in max_bytes.
+
+    Caches used within the garbage collection grace period are kept, as a
+    build may still be filling them.
+    """
+    logger = logging.getLogger(__name__)
+    if max_bytes is None:
+        max_bytes = settings.DEMO_CACHE_MAX_BYTES
+
+    entries = []
+    for manager in PACKAGE_MANAGERS:
+        manager_path = os.path.join(settings.DEMO_CACHE_DIR, manager)
+        if not os.path.isdir(manager_path):
+            continue
+        for key in os.listdir(manager_path):
+            path = os.path.join(manager_path, key)
+            entries.append((os.path.getmtime(path), _get_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    now = time.time()
+    for last_used, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if now - last_used < settings.DEMO_GC_GRACE_PERIOD:
+            continue
+        logger.info('Evicting dependency cache %s', path)
+        remove_tree_throttled(move_to_trash(path))
+        total -= size
+        evicted += 1
+    return evicted
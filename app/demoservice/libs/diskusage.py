@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from demoservice.libs.registry import set_demo_status
+from demoservice.models import Demo
+
+UNTRACKED_STATUSES = [Demo.STOPPING, Demo.STOPPED]
+EVICTABLE_STATUSES = [Demo.RUNNING, Demo.READY, Demo.FAILED]
+
+# A checkout is measured directory by directory. Each directory's own files
+# are only listed again when its modification time changes, which is what
+# creating, deleting or renaming an entry does, so measuring after a build
+# step costs a stat per directory rather than one per file.
+
+
+def _get_cache_path(demo_url):
+    return os.path.join(settings.DEMO_USAGE_DIR, demo_url + '.json')
+
+
+def _read_cache(demo_url):
+    path = _get_cache_path(demo_url)
+    try:
+        if time.time() - os.path.getmtime(path) > (
+            settings.DEMO_DISK_RESCAN_INTERVAL
+        ):
+            return {}
+        with open(path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(demo_url, cache):
+    os.makedirs(settings.DEMO_USAGE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=settings.DEMO_USAGE_DIR,
+        prefix='.usage-',
+        suffix='.tmp',
+    )
+    try:
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(cache, tmp_file)
+        os.replace(tmp_path, _get_cache_path(demo_url))
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _list_directory(path):
+    """Size of the files directly in a directory, and its subdirectories"""
+    size = 0
+    subdirectories = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.name)
+                else:
+                    size += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                pass
+    return size, subdirectories
+
+
+def measure_tree(path, cache):
+    """Bytes used by the files under path.
+
+    cache maps each directory, relative to path, to its modification time,
+    the size of its own files and its subdirectories. Returns the size and
+    the cache for the next measurement.
+    """
+    size = 0
+    new_cache = {}
+    directories = ['.']
+    while directories:
+        relative_path = directories.pop()
+        directory = os.path.join(path, relative_path)
+        try:
+            mtime = os.lstat(directory).st_mtime_ns
+            cached = cache.get(relative_path)
+            if cached and cached[0] == mtime:
+                _, files_size, subdirectories = cached
+            else:
+                files_size, subdirectories = _list_directory(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            # Removed while it was being measured
+            continue
+
+        new_cache[relative_path] = [mtime, files_size, subdirectories]
+        size += files_size
+        directories.extend(
+            os.path.normpath(os.path.join(relative_path, name))
+            for name in subdirectories
+        )
+    return size, new_cache
+
+
+def measure_demo(demo_url):
+    """Measure a demo checkout and record its size in the registry.
+
+    Measuring is best effort, a failure must never fail a build. Returns
+    the size in bytes, or None if it could not be measured.
+    """
+    logger = logging.getLogger(__name__)
+    local_path = os.path.join(settings.DEMO_DIR, demo_url)
+    try:
+        size, cache = measure_tree(local_path, _read_cache(demo_url))
+        _write_cache(demo_url, cache)
+    except Exception as e:
+        logger.warning('Could not measure %s: %s', demo_url, e)
+        return None
+
+    Demo.objects.filter(url=demo_url).update(
+        disk_usage=size,
+        disk_usage_at=timezone.now(),
+    )
+    return size
+
+
+def measure_demos():
+    """Measure every demo that has a checkout. Returns the total size"""
+    demos = Demo.objects.exclude(
+        status__in=UNTRACKED_STATUSES + [Demo.IDLE]
+    ).values_list('url', flat=True)
+    return sum(measure_demo(demo_url) or 0 for demo_url in demos)
+
+
+def forget_demo(demo_url):
+    """Stop accounting for a checkout that has been moved out of the way"""
+    try:
+        os.remove(_get_cache_path(demo_url))
+    except FileNotFoundError:
+        pass
+    Demo.objects.filter(url=demo_url).update(
+        disk_usage=0,
+        disk_usage_at=timezone.now(),
+    )
+
+
+def get_total_disk_usage():
+    return Demo.objects.exclude(status__in=UNTRACKED_STATUSES).aggregate(
+        total=Sum('disk_usage')
+    )['total'] or 0
+
+
+def get_disk_usage():
+    """Total and per demo disk usage, largest demos first"""
+    demos = Demo.objects.exclude(status__in=UNTRACKED_STATUSES).filter(
+        disk_usage__gt=0
+    ).order_by('-disk_usage')
+    return {
+        'total': get_total_disk_usage(),
+        'high_water': settings.DEMO_DISK_HIGH_WATER_BYTES,
+        'low_water': settings.DEMO_DISK_LOW_WATER_BYTES,
+        'demos': [
+            {
+                'url': demo.url,
+                'status': demo.status,
+                'disk_usage': demo.disk_usage,
+                'disk_usage_at': demo.disk_usage_at,
+            }
+            for demo in demos
+        ],
+    }
+
+
+def _queue_eviction(demo):
+    from celery import chain
+    from demoservice.tasks.github import reclaim_demo_task, stop_demo_task
+    from demoservice.tasks.launchpad import (
+        reclaim_launchpad_demo_task,
+        stop_launchpad_demo_task,
+    )
+
+    if demo.vcs_provider == Demo.LAUNCHPAD:
+        context = {
+            'demo_url': demo.url,
+            'user': demo.user,
+            'repo': demo.repo,
+            'branch': demo.branch,
+            'pr': demo.pr,
+        }
+        tasks = [stop_launchpad_demo_task, reclaim_launchpad_demo_task]
+    else:
+        context = {
+            'demo_url': demo.url,
+            'github_user': demo.user,
+            'github_repo': demo.repo,
+            'github_pr': demo.pr,
+        }
+        tasks = [stop_demo_task, reclaim_demo_task]
+    chain(
+        *[task.s(context=context, **context) for task in tasks]
+    ).apply_async()
+
+
+def make_disk_room():
+    """Stop the oldest demos if the checkouts are over the high-water mark.
+
+    Demos are stopped, oldest start first, until the checkouts fit under
+    the low-water mark. Demos started within the garbage collection grace
+    period are kept. Returns whether the checkouts are under the
+    high-water mark, ie. new builds can be admitted.
+    """
+    logger = logging.getLogger(__name__)
+    high_water = settings.DEMO_DISK_HIGH_WATER_BYTES
+    if not high_water:
+        return True
+
+    total = get_total_disk_usage()
+    if total <= high_water:
+        return True
+
+    since = timezone.now() - timedelta(seconds=settings.DEMO_GC_GRACE_PERIOD)
+    candidates = Demo.objects.filter(
+        status__in=EVICTABLE_STATUSES,
+        disk_usage__gt=0,
+        started_at__lt=since,
+    ).order_by('started_at', 'created_at')
+    for demo in candidates:
+        if total <= settings.DEMO_DISK_LOW_WATER_BYTES:
+            break
+        # Another process may have stopped or rebuilt it in the meantime
+        if not set_demo_status(
+            demo.url,
+            Demo.STOPPING,
+            from_status=EVICTABLE_STATUSES,
+            last_error='Stopped to free up disk space',
+        ):
+            continue
+        logger.warning(
+            'Evicting %s to free up %s bytes',
+            demo.url,
+            demo.disk_usage,
+        )
+        _queue_eviction(demo)
+        total -= demo.disk_usage
+    return total <= high_water
@@ -0,0 +1,125 @@
+import logging
+import queue
+import socket
+import threading
+import time
+from django.conf import settings
+from kombu import Connection, Exchange, Queue, pools
+
+# Demo lifecycle events are published by the tasks to a fanout exchange on
+# the message broker. Each web process has a single consumer which hands
+# them to the dashboards connected to that process.
+DEMO_EVENTS_EXCHANGE = Exchange(
+    'demoservice.events', type='fanout', durable=False
+)
+
+
+def _get_events_connection():
+    """Broker connection settings of the event producers.
+
+    Connections with the same settings share a pool, so this only says
+    which pool to use.
+    """
+    timeout = settings.DEMO_EVENTS_PUBLISH_TIMEOUT
+    return Connection(
+        settings.CELERY_BROKER_URL,
+        connect_timeout=timeout,
+        transport_options={
+            'max_retries': 1,
+            'interval_start': 0,
+            'read_timeout': timeout,
+            'write_timeout': timeout,
+        },
+    )
+
+
+def publish_demo_event(event):
+    """Send a demo event to every connected dashboard.
+
+    Events are best effort, a broker hiccup must never fail or hold up a
+    task. Producers come from a pool of their own, whose connections give
+    up after DEMO_EVENTS_PUBLISH_TIMEOUT seconds and a single reconnect
+    instead of retrying like the task producers, and the event is dropped.
+    """
+    logger = logging.getLogger(__name__)
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return
+
+    timeout = settings.DEMO_EVENTS_PUBLISH_TIMEOUT
+    try:
+        with pools.producers[_get_events_connection()].acquire(
+            block=True, timeout=timeout
+        ) as producer:
+            producer.publish(
+                event,
+                exchange=DEMO_EVENTS_EXCHANGE,
+                declare=[DEMO_EVENTS_EXCHANGE],
+                serializer='json',
+                retry=False,
+            )
+    except Exception as e:
+        logger.warning('Could not publish demo event: %s', e)
+
+
+class DemoEventBroadcaster:
+    """Consumes demo events in a background thread and fans them out"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=settings.DEMO_EVENTS_BUFFER)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._consume,
+                    name='demo-events',
+                    daemon=True,
+                )
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _broadcast(self, event, message):
+        message.ack()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client only loses its own events
+                pass
+
+    def _consume(self):
+        logger = logging.getLogger(__name__)
+        while True:
+            try:
+                with Connection(settings.CELERY_BROKER_URL) as connection:
+                    events_queue = Queue(
+                        exchange=DEMO_EVENTS_EXCHANGE,
+                        exclusive=True,
+                        auto_delete=True,
+                    )
+                    with connection.Consumer(
+                        [events_queue],
+                        callbacks=[self._broadcast],
+                        accept=['json'],
+                    ):
+                        while True:
+                            try:
+                                connection.drain_events(timeout=1)
+                            except socket.timeout:
+                                pass
+            except Exception as e:
+                logger.warning('Demo event consumer failed: %s', e)
+                time.sleep(5)
+
+
+broadcaster = DemoEventBroadcaster()
@@ -0,0 +1,185 @@
+import logging
+import time
+from django.conf import settings
+from demoservice.libs.ratelimit import block_bucket, take_token
+
+GITHUB_API_URL = 'https://api.github.com'
+GITHUB_BUCKET = 'github'
+COMMENT_MARKER = '<!-- demoservice -->'
+
+# Login of the account behind each token, looked up once per process
+_bot_logins = {}
+
+
+class GitHubRateLimited(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            'GitHub rate limit reached, retry in {:.0f}s'.format(retry_after)
+        )
+
+
+def _get_retry_after(response):
+    """Work out how long GitHub wants us to wait, if at all"""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        return float(retry_after)
+
+    remaining = response.headers.get('X-RateLimit-Remaining')
+    reset = response.headers.get('X-RateLimit-Reset')
+    if remaining is not None and int(remaining) == 0 and reset:
+        return max(int(reset) - time.time(), 1)
+
+    if response.status_code in (403, 429):
+        # Secondary rate limits don't always come with a header
+        if b'rate limit' in response.content.lower():
+            return settings.GITHUB_SECONDARY_RATE_LIMIT_WAIT
+
+    return 0
+
+
+def github_request(session, method, path, **kwargs):
+    """Make a GitHub API request through the shared token bucket.
+
+    Raises GitHubRateLimited when no token is available or when GitHub
+    tells us to slow down, so the caller can retry after retry_after
+    seconds instead of hammering the API.
+    """
+    wait = take_token(
+        GITHUB_BUCKET,
+        rate=settings.GITHUB_RATE_LIMIT_PER_SECOND,
+        capacity=settings.GITHUB_RATE_LIMIT_BURST,
+    )
+    if wait:
+        raise GitHubRateLimited(wait)
+
+    headers = {
+        'Authorization': 'token {token}'.format(token=settings.GITHUB_TOKEN),
+        'Accept': 'application/vnd.github.v3+json',
+    }
+    response = session.request(
+        method,
+        GITHUB_API_URL + path,
+        headers=headers,
+        timeout=settings.GITHUB_API_TIMEOUT,
+        **kwargs
+    )
+
+    retry_after = _get_retry_after(response)
+    if retry_after:
+        block_bucket(
+            GITHUB_BUCKET,
+            retry_after,
+            capacity=settings.GITHUB_RATE_LIMIT_BURST,
+        )
+        if response.status_code in (403, 429):
+            raise GitHubRateLimited(retry_after)
+
+    return response
+
+
+def _get_bot_login(session):
+    token = settings.GITHUB_TOKEN
+    if token not in _bot_logins:
+        response = github_request(session, 'GET', '/user')
+        response.raise_for_status()
+        _bot_logins[token] = response.json()['login']
+    return _bot_logins[token]
+
+
+def _find_bot_comment(session, comments_path):
+    """Our comment on a PR: it has the marker and was written by us.
+
+    Anybody can paste the marker into a comment, only the author tells
+    our comments apart.
+    """
+    bot_login = _get_bot_login(session)
+    page = 1
+    while True:
+        response = github_request(
+            session,
+            'GET',
+            comments_path,
+            params={'per_page': 100, 'page': page},
+        )
+        response.raise_for_status()
+        comments = response.json()
+        for comment in comments:
+            author = (comment.get('user') or {}).get('login')
+            if author != bot_login:
+                continue
+            if COMMENT_MARKER in comment.get('body', ''):
+                return comment
+        if 'rel="next"' not in response.headers.get('Link', ''):
+            return None
+        page += 1
+
+
+def get_open_prs(session, github_user, github_repo):
+    """Numbers of the open pull requests of a repository, as strings"""
+    path = '/repos/{user}/{repo}/pulls'.format(
+        user=github_user,
+        repo=github_repo,
+    )
+    numbers = set()
+    page = 1
+    while True:
+        response = github_request(
+            session,
+            'GET',
+            path,
+            params={'state': 'open', 'per_page': 100, 'page': page},
+        )
+        response.raise_for_status()
+        numbers.update(str(pr['number']) for pr in response.json())
+        if 'rel="next"' not in response.headers.get('Link', ''):
+            return numbers
+        page += 1
+
+
+def upsert_pr_comment(message, github_user, github_repo, github_pr):
+    """Update the demoservice comment on a PR in place, or create it.
+
+    Returns the comment ID.
+    """
+    import requests
+
+    logger = logging.getLogger(__name__)
+    comments_path = '/repos/{user}/{repo}/issues/{pr}/comments'.format(
+        user=github_user,
+        repo=github_repo,
+        pr=github_pr,
+    )
+    body = '\n\n'.join([message, COMMENT_MARKER])
+
+    session = requests.session()
+    comment = _find_bot_comment(session, comments_path)
+    if comment:
+        logger.debug('Updating comment %s', comment['id'])
+        response = github_request(
+            session,
+            'PATCH',
+            '/repos/{user}/{repo}/issues/comments/{id}'.format(
+                user=github_user,
+                repo=github_repo,
+                id=comment['id'],
+            ),
+            json={'body': body},
+        )
+        expected_status = 200
+    else:
+        response = github_request(
+            session,
+            'POST',
+            comments_path,
+            json={'body': body},
+        )
+        expected_status = 201
+
+    if response.status_code != expected_status:
+        raise Exception(
+            'Failed to notify Github: {content}'.format(
+                content=response.content
+            )
+        )
+    return response.json()['id']
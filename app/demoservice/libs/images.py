@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import re
+from subprocess import check_output
+from django.conf import settings
+from django.utils import timezone
+from demoservice.libs.blobfacts import get_blob_sha
+from demoservice.models import CachedImage
+
+# Built demo images get a second tag per repository and source hash. Stops
+# only remove the demo tag, so a start of the same source, for a reopened
+# merge proposal or another one at the same commit, can reuse the image.
+CACHE_IMAGE_NAME = 'demo-cache/{repo}'
+
+
+def get_source_hash(local_path, docker_file_path):
+    """Hash of the checked out tree and of the Dockerfile used to build it.
+
+    The Dockerfile may not be part of the tree, it can come from
+    DOCKERFILE_REPO_TEMPLATE instead.
+    """
+    tree_sha = (
+        check_output(['git', 'rev-parse', 'HEAD^{tree}'], cwd=local_path)
+        .decode('utf-8')
+        .strip()
+    )
+    sha = hashlib.sha1()
+    sha.update(tree_sha.encode('utf-8'))
+    sha.update(get_blob_sha(docker_file_path).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _get_cache_tag(repo, source_hash):
+    # Docker image names are lowercase
+    name = re.sub(r'[^a-z0-9._-]', '-', repo.lower())
+    return '{image}:{tag}'.format(
+        image=CACHE_IMAGE_NAME.format(repo=name),
+        tag=source_hash,
+    )
+
+
+def get_cached_image(client, node, repo, source_hash):
+    """Tag of an image built from the same source, or None"""
+    from docker.errors import ImageNotFound
+
+    image = CachedImage.objects.filter(
+        node=node,
+        repo=repo,
+        source_hash=source_hash,
+    ).first()
+    if not image:
+        return None
+
+    try:
+        client.images.get(image.tag)
+    except ImageNotFound:
+        image.delete()
+        return None
+
+    image.last_used_at = timezone.now()
+    image.save(update_fields=['last_used_at'])
+    return image.tag
+
+
+def store_image(client, node, repo, source_hash, image_name):
+    """Keep the image just built as image_name for starts of the same source.
+
+    Storing is best effort, a failure only means the next start builds.
+    """
+    logger = logging.getLogger(__name__)
+    tag = _get_cache_tag(repo, source_hash)
+    try:
+        image = client.images.get(image_name)
+        cache_name, _, cache_version = tag.rpartition(':')
+        image.tag(cache_name, tag=cache_version)
+    except Exception as e:
+        logger.warning('Could not store image %s: %s', image_name, e)
+        return False
+
+    CachedImage.objects.update_or_create(
+        node=node,
+        repo=repo,
+        source_hash=source_hash,
+        defaults={
+            'tag': tag,
+            'size': image.attrs['Size'],
+            'last_used_at': timezone.now(),
+        },
+    )
+    evict_images(client, node)
+    return True
+
+
+def evict_images(client, node, max_bytes=None):
+    """Drop the least recently used images until they fit in max_bytes.
+
+    Sizes include layers shared between images, so the total is an upper
+    bound of the space they take. Images still used by a demo only lose
+    their cache tag.
+    """
+    from docker.errors import APIError, ImageNotFound
+
+    logger = logging.getLogger(__name__)
+    if max_bytes is None:
+        max_bytes = settings.DEMO_IMAGE_CACHE_MAX_BYTES
+
+    images = list(
+        CachedImage.objects.filter(node=node).order_by('last_used_at')
+    )
+    total = sum(image.size for image in images)
+    evicted = 0
+    for image in images:
+        if total <= max_bytes:
+            break
+        logger.info('Evicting image %s', image.tag)
+        try:
+            client.images.remove(image=image.tag)
+        except ImageNotFound:
+            pass
+        except APIError as e:
+            logger.warning('Could not evict image %s: %s', image.tag, e)
+            continue
+        image.delete()
+        total -= image.size
+        evicted += 1
+    return evicted
@@ -0,0 +1,47 @@
+from django.conf import settings
+from demoservice.libs.registry import set_demo_status
+from demoservice.models import Demo, PendingStart
+from demoservice.tasks.scheduler import dispatch_starts_task
+
+AWAKE_STATUSES = [Demo.QUEUED, Demo.BUILDING, Demo.RUNNING, Demo.READY]
+
+# Demos of lazy repositories are only recorded when their pull request is
+# opened or updated. Their start is held back until somebody visits the
+# demo, Traefik sends those visits to the placeholder of the web service.
+
+
+def is_lazy_repo(user, repo):
+    lazy_repos = settings.DEMO_LAZY_REPOS
+    return '/'.join([user, repo]) in lazy_repos or user in lazy_repos
+
+
+def should_hold_start(demo_url, user, repo):
+    """Whether a start should wait for the first visit of the demo.
+
+    A push to a lazy demo that has been visited already rebuilds it
+    straight away, somebody is looking at it.
+    """
+    if not is_lazy_repo(user, repo):
+        return False
+    return not Demo.objects.filter(
+        url=demo_url,
+        status__in=AWAKE_STATUSES,
+    ).exists()
+
+
+def wake_demo(demo_url):
+    """Release the held start of a lazy demo.
+
+    Returns whether the demo was woken up by this call, concurrent visits
+    only start it once.
+    """
+    woken = PendingStart.objects.filter(
+        demo_url=demo_url,
+        held=True,
+    ).update(held=False)
+    if not woken:
+        return False
+
+    set_demo_status(demo_url, Demo.QUEUED, from_status=Demo.IDLE)
+    dispatch_starts_task.delay()
+    return True
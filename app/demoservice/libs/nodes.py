@@ -0,0 +1,201 @@
+import logging
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from demoservice.models import Demo, Node
+
+ACTIVE_STATUSES = [Demo.QUEUED, Demo.BUILDING, Demo.RUNNING, Demo.READY]
+# Demos without containers, their node doesn't matter yet or anymore
+UNPLACED_STATUSES = [Demo.IDLE, Demo.QUEUED, Demo.STOPPED]
+
+# Docker clients per process and engine, they keep their connections open
+_docker_clients = {}
+_docker_clients_lock = threading.Lock()
+
+
+def get_nodes():
+    """Nodes to look for demos on.
+
+    The local Docker engine, represented by None, is included while there
+    is no registered node to run demos on, or it still has demos.
+    """
+    nodes = list(Node.objects.all())
+    has_local_demos = Demo.objects.filter(node__isnull=True).exclude(
+        status__in=UNPLACED_STATUSES
+    ).exists()
+    if not nodes or has_local_demos:
+        nodes.append(None)
+    return nodes
+
+
+def _get_default_gateway():
+    with open('/proc/net/route') as routes:
+        next(routes)
+        for line in routes:
+            fields = line.split()
+            # The default route, with the gateway flag set
+            if fields[1] == '00000000' and int(fields[3], 16) & 2:
+                return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+    return None
+
+
+def get_docker_host_address():
+    """Where this process reaches ports published by the local engine.
+
+    Inside a container localhost is the container itself, so the ports are
+    reached through the Docker host, the gateway of the default route.
+    """
+    if not os.path.exists('/.dockerenv'):
+        return 'localhost'
+    try:
+        return _get_default_gateway() or 'localhost'
+    except (OSError, StopIteration, ValueError, IndexError):
+        return 'localhost'
+
+
+def _create_docker_client(base_url):
+    # Imported here so web processes don't load the Docker SDK
+    import docker
+
+    if base_url is None:
+        return docker.from_env(timeout=settings.DEMO_DOCKER_TIMEOUT)
+    return docker.DockerClient(
+        base_url=base_url,
+        timeout=settings.DEMO_DOCKER_TIMEOUT,
+    )
+
+
+def get_docker_client(node=None):
+    """A Docker client for the node's engine, shared within the process.
+
+    A client that hasn't been checked for DEMO_DOCKER_PING_INTERVAL seconds
+    pings its engine first, and is replaced if the engine doesn't answer.
+    Every call times out after DEMO_DOCKER_TIMEOUT seconds, so a hung
+    engine can't block a worker forever.
+    """
+    logger = logging.getLogger(__name__)
+    base_url = node.docker_url if node else None
+    pid = os.getpid()
+    key = (pid, base_url)
+    now = time.monotonic()
+
+    with _docker_clients_lock:
+        entry = _docker_clients.get(key)
+    if entry:
+        if now - entry['checked_at'] < settings.DEMO_DOCKER_PING_INTERVAL:
+            return entry['client']
+        try:
+            entry['client'].ping()
+            entry['checked_at'] = now
+            return entry['client']
+        except Exception as e:
+            logger.warning(
+                'Reconnecting to Docker engine %s: %s',
+                base_url or 'local',
+                e,
+            )
+            entry['client'].close()
+
+    client = _create_docker_client(base_url)
+    with _docker_clients_lock:
+        # Forked processes must not share the connections of their parent
+        for stale_key in [k for k in _docker_clients if k[0] != pid]:
+            del _docker_clients[stale_key]
+        _docker_clients[key] = {'client': client, 'checked_at': now}
+    return client
+
+
+def get_docker_env(env, node=None):
+    """Point the docker CLI used by ./run at the node's engine"""
+    env = env.copy()
+    if node is not None:
+        env['DOCKER_HOST'] = node.docker_url
+    return env
+
+
+def get_demo_node(demo_url):
+    demo = Demo.objects.filter(url=demo_url).select_related('node').first()
+    if demo:
+        return demo.node
+    return None
+
+
+def pick_node():
+    """Pick the enabled node with the most free capacity"""
+    logger = logging.getLogger(__name__)
+    nodes = Node.objects.filter(enabled=True).annotate(
+        active_demos=Count(
+            'demos',
+            filter=Q(demos__status__in=ACTIVE_STATUSES),
+        )
+    )
+    if not nodes:
+        return None
+
+    node = max(nodes, key=lambda node: node.capacity - node.active_demos)
+    if node.active_demos >= node.capacity:
+        logger.warning('All nodes are full, using %s', node.name)
+    return node
+
+
+def place_demo(demo_url):
+    """Return the node of a demo, scheduling it on one if needed.
+
+    Demos stay on the node they were first placed on, as their checkout
+    and containers live there.
+    """
+    with transaction.atomic():
+        demo = (
+            Demo.objects.select_for_update()
+            .select_related('node')
+            .filter(url=demo_url)
+            .first()
+        )
+        if demo is None:
+            return None
+        if demo.node and demo.node.enabled:
+            return demo.node
+
+        demo.node = pick_node()
+        demo.save(update_fields=['node'])
+        return demo.node
+
+
+def reserve_port(demo_url, node, published_ports):
+    """Record a free port of the node on the demo, and return it.
+
+    Ports are picked at random from DEMO_PORT_RANGE, below the range Docker
+    assigns from, skipping published_ports and the ports of the other
+    active demos on the node. Those demos are locked while the port is
+    picked, so concurrent starts on a node never get the same one.
+    """
+    with transaction.atomic():
+        demos = list(
+            Demo.objects.select_for_update()
+            .filter(node=node)
+            .order_by('pk')
+        )
+        taken = set(published_ports)
+        taken.update(
+            demo.port
+            for demo in demos
+            if demo.url != demo_url
+            and demo.port
+            and demo.status in ACTIVE_STATUSES
+        )
+        low, high = settings.DEMO_PORT_RANGE
+        free_ports = [port for port in range(low, high) if port not in taken]
+        if not free_ports:
+            raise Exception('No free port on {}'.format(
+                node.name if node else 'the local Docker engine'
+            ))
+
+        port = random.choice(free_ports)
+        Demo.objects.filter(url=demo_url).update(port=port)
+        return port
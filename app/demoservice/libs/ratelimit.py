@@ -0,0 +1,53 @@
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from demoservice.models import RateLimitBucket
+
+
+def _get_bucket(name, capacity):
+    try:
+        bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+            name=name,
+            defaults={'tokens': capacity, 'updated_at': timezone.now()},
+        )
+    except IntegrityError:
+        # Another worker created the bucket at the same time
+        bucket = RateLimitBucket.objects.select_for_update().get(name=name)
+    return bucket
+
+
+def take_token(name, rate, capacity):
+    """Take a token from the named bucket.
+
+    Returns 0 when a token was taken, otherwise the number of seconds to
+    wait before trying again. The bucket lives in the database so it is
+    shared by every worker.
+    """
+    with transaction.atomic():
+        bucket = _get_bucket(name, capacity)
+        now = timezone.now()
+
+        if bucket.blocked_until and bucket.blocked_until > now:
+            return (bucket.blocked_until - now).total_seconds()
+
+        elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+        bucket.tokens = min(capacity, bucket.tokens + elapsed * rate)
+        bucket.updated_at = now
+
+        wait = 0
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+        else:
+            wait = (1 - bucket.tokens) / rate
+        bucket.save()
+        return wait
+
+
+def block_bucket(name, seconds, capacity):
+    """Stop handing out tokens for the next number of seconds"""
+    with transaction.atomic():
+        bucket = _get_bucket(name, capacity)
+        blocked_until = timezone.now() + timedelta(seconds=seconds)
+        if not bucket.blocked_until or bucket.blocked_until < blocked_until:
+            bucket.blocked_until = blocked_until
+            bucket.save()
@@ -0,0 +1,101 @@
+from datetime import timedelta
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.db.models import Avg, Count
+from django.utils import timezone
+from demoservice.libs.nodes import get_docker_host_address
+from demoservice.models import StartTiming
+
+
+def _get_probe_urls(demo):
+    """The demo's port on its host, then the public URL through Traefik"""
+    host = settings.DEMO_PROBE_HOST or get_docker_host_address()
+    if demo.node:
+        host = demo.node.address
+    path = urlsplit(demo.url_full).path or '/'
+
+    urls = [
+        'http://{host}:{port}{path}'.format(
+            host=host,
+            port=demo.port,
+            path=path,
+        )
+    ]
+    if settings.DEMO_PROBE_PUBLIC_URL and demo.url_full:
+        urls.append(demo.url_full)
+    return urls
+
+
+def is_ready_response(url, demo, status_code):
+    """Whether a probe answer means the demo is up"""
+    if status_code >= 500:
+        return False
+    if status_code == 404 and url == demo.url_full:
+        return False
+    return True
+
+
+def is_demo_ready(demo):
+    """Whether the demo answers without a server or gateway error.
+
+    Traefik answers 404 for hosts it has no route to yet, so a 404 from the
+    public URL doesn't count either.
+    """
+    import requests
+
+    for url in _get_probe_urls(demo):
+        try:
+            response = requests.get(
+                url,
+                timeout=settings.DEMO_PROBE_TIMEOUT,
+                allow_redirects=False,
+            )
+        except requests.RequestException:
+            return False
+        if not is_ready_response(url, demo, response.status_code):
+            return False
+    return True
+
+
+def get_ready_deadline(demo):
+    return demo.running_at + timedelta(seconds=settings.DEMO_READY_TIMEOUT)
+
+
+def get_probe_delay(retries):
+    return min(2 ** retries, settings.DEMO_PROBE_INTERVAL)
+
+
+def _seconds_between(start, end):
+    if start and end:
+        return (end - start).total_seconds()
+    return None
+
+
+def record_start_timing(demo, is_ready):
+    now = timezone.now()
+    return StartTiming.objects.create(
+        demo_url=demo.url,
+        vcs_provider=demo.vcs_provider,
+        user=demo.user,
+        repo=demo.repo,
+        build_seconds=_seconds_between(demo.started_at, demo.running_at),
+        ready_seconds=_seconds_between(demo.running_at, now),
+        total_seconds=_seconds_between(demo.queued_at, now),
+        is_ready=is_ready,
+    )
+
+
+def get_time_to_ready_by_repo(days=7):
+    """Average start times per repository over the last few days"""
+    since = timezone.now() - timedelta(days=days)
+    return (
+        StartTiming.objects.filter(created_at__gte=since, is_ready=True)
+        .values('user', 'repo')
+        .annotate(
+            starts=Count('id'),
+            build_seconds=Avg('build_seconds'),
+            ready_seconds=Avg('ready_seconds'),
+            total_seconds=Avg('total_seconds'),
+        )
+        .order_by('-total_seconds')
+    )
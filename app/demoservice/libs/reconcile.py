@@ -0,0 +1,367 @@
+import logging
+import os
+import time
+from django.conf import settings
+from launchpadlib.launchpad import Launchpad
+from demoservice.libs.demos import (
+    reclaim_demo,
+    reclaim_launchpad_demo,
+    stop_demo,
+    stop_launchpad_demo,
+)
+from demoservice.libs.depcache import evict_caches
+from demoservice.libs.github_api import GitHubRateLimited, get_open_prs
+from demoservice.libs.nodes import get_docker_client, get_nodes
+from demoservice.libs.registry import set_demo_status
+from demoservice.libs.routing import update_routes
+from demoservice.libs.trash import move_to_trash, remove_tree_throttled
+from demoservice.models import Demo, Node
+
+DEMO_DOMAIN = '.run.demo.haus'
+LAUNCHPAD_CLOSED_STATUSES = ['Merged', 'Rejected', 'Superseded']
+LIVE_STATUSES = [Demo.RUNNING, Demo.READY]
+CLOSED_DEMO = 'closed demo'
+CHECKOUT = 'orphaned checkout'
+IMAGE = 'orphaned image'
+VOLUME = 'orphaned volume'
+
+
+def _get_demo_containers(client):
+    """Group every run.demo container, running or not, by demo URL"""
+    demos = {}
+    containers = client.containers.list(
+        all=True,
+        filters={
+            'label': 'run.demo',
+        }
+    )
+    for container in containers:
+        labels = container.labels
+        url = labels.get('run.demo.url')
+        if not url:
+            continue
+        demo = demos.setdefault(url, {'labels': labels, 'containers': []})
+        demo['containers'].append(container)
+    return demos
+
+
+def _get_real_demos(demos):
+    """Leave out the fake demos of bin/create_fake_demo"""
+    return {
+        url: demo for url, demo in demos.items()
+        if not demo['labels'].get('run.demo.fake')
+    }
+
+
+def sync_registry():
+    for node in get_nodes():
+        _sync_node_registry(node)
+    # Puts back a routing file that missed an update
+    update_routes()
+
+
+def _sync_node_registry(node):
+    """Bring the demo registry in line with the containers on a node.
+
+    Demos started outside of the service are added, and demos the registry
+    believes are running but have no running container are marked failed.
+    """
+    client = get_docker_client(node)
+    demos = _get_demo_containers(client)
+
+    running_urls = set()
+    for url, demo in demos.items():
+        if any(c.status == 'running' for c in demo['containers']):
+            running_urls.add(url)
+
+    known_urls = set(Demo.objects.values_list('url', flat=True))
+    for url in sorted(running_urls - known_urls):
+        labels = demos[url]['labels']
+        Demo.objects.create(
+            url=url,
+            url_full=labels.get('run.demo.url_full', url),
+            vcs_provider=labels.get('run.demo.vcs_provider', Demo.GITHUB),
+            user=labels.get('run.demo.github_user', ''),
+            repo=labels.get('run.demo.github_repo', ''),
+            pr=labels.get('run.demo.github_pr', ''),
+            branch=labels.get('run.demo.github_branch', ''),
+            node=node,
+            status=Demo.READY,
+        )
+
+    lost_urls = (
+        Demo.objects.filter(status__in=LIVE_STATUSES, node=node)
+        .exclude(url__in=running_urls)
+        .values_list('url', flat=True)
+    )
+    for url in lost_urls:
+        set_demo_status(
+            url,
+            Demo.FAILED,
+            from_status=LIVE_STATUSES,
+            last_error='Demo container is no longer running',
+        )
+
+
+def _get_open_github_prs(repos):
+    """Look up the open pull requests once per repository.
+
+    Returns a dict of (user, repo) to a set of open PR numbers. Repositories
+    that could not be checked are left out so their demos are never treated
+    as closed.
+    """
+    import requests
+
+    logger = logging.getLogger(__name__)
+    session = requests.session()
+    open_prs = {}
+    for user, repo in repos:
+        try:
+            open_prs[(user, repo)] = get_open_prs(session, user, repo)
+        except GitHubRateLimited as e:
+            # The rest would be refused as well, they wait for the next run
+            logger.warning('Stopped listing pull requests: %s', e)
+            break
+        except Exception as e:
+            logger.error(
+                'Could not list pull requests of %s/%s: %s', user, repo, e
+            )
+    return open_prs
+
+
+def _is_launchpad_mp_closed(lp, user, repo, pr):
+    logger = logging.getLogger(__name__)
+    path = '{user}/{repo}/+git/{repo}/+merge/{pr}'.format(
+        user=user,
+        repo=repo,
+        pr=pr,
+    )
+    try:
+        merge_proposal = lp.load(path)
+    except Exception as e:
+        logger.error('Could not load merge proposal %s: %s', path, e)
+        return False
+    return merge_proposal.queue_status in LAUNCHPAD_CLOSED_STATUSES
+
+
+def get_closed_demo_urls(demos):
+    """Return the URLs of demos whose PR or MP is confirmed closed"""
+    github_repos = set()
+    for demo in demos.values():
+        labels = demo['labels']
+        if labels.get('run.demo.vcs_provider', 'github') != 'github':
+            continue
+        if labels.get('run.demo.github_pr'):
+            github_repos.add((
+                labels.get('run.demo.github_user'),
+                labels.get('run.demo.github_repo'),
+            ))
+
+    open_prs = {}
+    if github_repos:
+        open_prs = _get_open_github_prs(sorted(github_repos))
+
+    lp = None
+    closed = set()
+    for url, demo in demos.items():
+        labels = demo['labels']
+        user = labels.get('run.demo.github_user')
+        repo = labels.get('run.demo.github_repo')
+        pr = labels.get('run.demo.github_pr')
+        if not pr:
+            continue
+
+        provider = labels.get('run.demo.vcs_provider', 'github')
+        if provider == 'github':
+            repo_prs = open_prs.get((user, repo))
+            if repo_prs is not None and str(pr) not in repo_prs:
+                closed.add(url)
+        elif provider == 'launchpad':
+            if lp is None:
+                lp = Launchpad.login_anonymously('demoservice', 'production')
+            if _is_launchpad_mp_closed(lp, user, repo, pr):
+                closed.add(url)
+    return closed
+
+
+def _remove_closed_demo(url, labels):
+    if labels.get('run.demo.vcs_provider') == 'launchpad':
+        trash_path = stop_launchpad_demo(demo_url=url)
+        reclaim_launchpad_demo(trash_path=trash_path, demo_url=url)
+    else:
+        trash_path = stop_demo(demo_url=url)
+        reclaim_demo(trash_path=trash_path, demo_url=url)
+
+
+def _is_older_than(path, seconds):
+    try:
+        return time.time() - os.path.getmtime(path) > seconds
+    except FileNotFoundError:
+        return False
+
+
+def _get_registered_urls():
+    """Demos the registry still accounts for, with or without containers.
+
+    Queued, building, failed and idle lazy demos keep their checkout.
+    """
+    return set(
+        Demo.objects.exclude(status=Demo.STOPPED).values_list(
+            'url', flat=True
+        )
+    )
+
+
+def _get_orphaned_directories(demos):
+    """Checkouts under DEMO_DIR that no demo accounts for.
+
+    demos holds the URLs of the demo containers and of the registry.
+    Recently touched directories are skipped as they are most likely demos
+    that are still being built.
+    """
+    if not os.path.isdir(settings.DEMO_DIR):
+        return []
+
+    orphans = []
+    for name in sorted(os.listdir(settings.DEMO_DIR)):
+        path = os.path.join(settings.DEMO_DIR, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        if name in demos:
+            continue
+        if _is_older_than(path, settings.DEMO_GC_GRACE_PERIOD):
+            orphans.append(path)
+
+    # Staged trees left behind by a worker that died during a start
+    if os.path.isdir(settings.DEMO_STAGING_DIR):
+        for name in sorted(os.listdir(settings.DEMO_STAGING_DIR)):
+            path = os.path.join(settings.DEMO_STAGING_DIR, name)
+            if _is_older_than(path, settings.DEMO_GC_GRACE_PERIOD):
+                orphans.append(path)
+    return orphans
+
+
+def _get_orphaned_images(client, demos):
+    orphans = []
+    for image in client.images.list():
+        for tag in image.tags:
+            name = tag.rsplit(':', 1)[0]
+            if not name.endswith(DEMO_DOMAIN) or name in demos:
+                continue
+            # Skip images of demos that are still being started
+            local_path = os.path.join(settings.DEMO_DIR, name)
+            if os.path.isdir(local_path) and not _is_older_than(
+                local_path, settings.DEMO_GC_GRACE_PERIOD
+            ):
+                continue
+            orphans.append(tag)
+    return orphans
+
+
+def _get_orphaned_volumes(client, demos):
+    orphans = []
+    volumes = client.volumes.list(filters={'dangling': True})
+    for volume in volumes:
+        if DEMO_DOMAIN not in volume.name:
+            continue
+        if not any(volume.name.startswith(url) for url in demos):
+            orphans.append(volume)
+    return orphans
+
+
+def _sweep_trash():
+    if not os.path.isdir(settings.DEMO_TRASH_DIR):
+        return
+    for name in os.listdir(settings.DEMO_TRASH_DIR):
+        path = os.path.join(settings.DEMO_TRASH_DIR, name)
+        if _is_older_than(path, settings.DEMO_GC_GRACE_PERIOD):
+            remove_tree_throttled(path)
+
+
+def remove_garbage(kind, target, labels=None, node_id=None):
+    """Remove one item found by collect_garbage"""
+    if kind == CLOSED_DEMO:
+        _remove_closed_demo(target, labels)
+    elif kind == CHECKOUT:
+        remove_tree_throttled(move_to_trash(target))
+    else:
+        node = None
+        if node_id is not None:
+            node = Node.objects.get(pk=node_id)
+        client = get_docker_client(node)
+        if kind == IMAGE:
+            client.images.remove(target)
+        elif kind == VOLUME:
+            client.volumes.get(target).remove()
+
+
+def _queue_removals(removals):
+    from demoservice.tasks.maintenance import remove_garbage_task
+
+    logger = logging.getLogger(__name__)
+    for index, removal in enumerate(removals):
+        logger.info(
+            'Garbage collecting %s %s', removal['kind'], removal['target']
+        )
+        remove_garbage_task.apply_async(
+            kwargs=removal,
+            countdown=index * settings.DEMO_GC_REMOVAL_PAUSE,
+        )
+
+
+def collect_garbage():
+    """Remove demos and leftovers that no open PR or MP accounts for.
+
+    Compares the demo containers, checkouts, images and volumes on every
+    node with the open pull requests, merge proposals and the demo
+    registry. Removals are capped per run and queued as tasks of their own,
+    DEMO_GC_REMOVAL_PAUSE seconds apart, so a big clean up doesn't hold a
+    worker or compete with running builds. Returns the number of queued
+    removals.
+    """
+    logger = logging.getLogger(__name__)
+    nodes = get_nodes()
+    clients = [get_docker_client(node) for node in nodes]
+
+    demos = {}
+    for client in clients:
+        demos.update(_get_demo_containers(client))
+    # Fake demos have no PR to close, but their URLs are still in use
+    closed_urls = get_closed_demo_urls(_get_real_demos(demos))
+    in_use = set(demos) | _get_registered_urls()
+
+    removals = []
+    for url in sorted(closed_urls):
+        removals.append({
+            'kind': CLOSED_DEMO,
+            'target': url,
+            'labels': demos[url]['labels'],
+        })
+    for path in _get_orphaned_directories(in_use):
+        removals.append({'kind': CHECKOUT, 'target': path})
+    for node, client in zip(nodes, clients):
+        node_id = node.pk if node else None
+        for tag in _get_orphaned_images(client, in_use):
+            removals.append({
+                'kind': IMAGE,
+                'target': tag,
+                'node_id': node_id,
+            })
+        for volume in _get_orphaned_volumes(client, in_use):
+            removals.append({
+                'kind': VOLUME,
+                'target': volume.name,
+                'node_id': node_id,
+            })
+
+    max_removals = settings.DEMO_GC_MAX_REMOVALS
+    _queue_removals(removals[:max_removals])
+    if len(removals) > max_removals:
+        logger.info(
+            '%s removals left for the next run',
+            len(removals) - max_removals,
+        )
+
+    evict_caches()
+    _sweep_trash()
+    return min(len(removals), max_removals)
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.utils import timezone
+from demoservice.libs.events import publish_demo_event
+from demoservice.libs.routing import queue_route_update
+from demoservice.models import Demo, PendingStart
+
+STATUS_TIMESTAMPS = {
+    Demo.QUEUED: 'queued_at',
+    Demo.BUILDING: 'started_at',
+    Demo.RUNNING: 'running_at',
+    Demo.READY: 'ready_at',
+    Demo.STOPPED: 'stopped_at',
+}
+CANCELLED_STATUSES = [Demo.STOPPING, Demo.STOPPED]
+
+
+class DemoCancelled(Exception):
+    pass
+
+
+def _publish_status(demo_url, status, last_error=''):
+    publish_demo_event({
+        'url': demo_url,
+        'status': status,
+        'status_display': dict(Demo.STATUS_CHOICES)[status],
+        'last_error': last_error,
+    })
+
+
+def register_demo(
+    demo_url,
+    vcs_provider,
+    user,
+    repo,
+    pr=None,
+    branch=None,
+    start_task_id='',
+    status=Demo.QUEUED,
+):
+    """Create or refresh the registry entry of a demo being queued.
+
+    Lazy demos are registered as IDLE until somebody visits them.
+    """
+    defaults = {
+        'vcs_provider': vcs_provider,
+        'user': user,
+        'repo': repo,
+        'pr': str(pr or ''),
+        'branch': branch or '',
+        'status': status,
+        'last_error': '',
+        'start_task_id': start_task_id,
+    }
+    if status in STATUS_TIMESTAMPS:
+        defaults[STATUS_TIMESTAMPS[status]] = timezone.now()
+    demo, _ = Demo.objects.update_or_create(url=demo_url, defaults=defaults)
+    _publish_status(demo_url, status)
+    queue_route_update()
+    return demo
+
+
+def set_demo_status(demo_url, status, from_status=None, **fields):
+    """Move a demo to a new status, stamping the matching timestamp.
+
+    Extra keyword arguments are saved on the demo as well. With from_status
+    (a status or a list of them) the demo is only updated if it currently
+    has that status. Returns the
+    number of updated demos, which is 0 for demos that were never
+    registered.
+    """
+    now = timezone.now()
+    fields['status'] = status
+    fields['updated_at'] = now
+    if status in STATUS_TIMESTAMPS:
+        fields[STATUS_TIMESTAMPS[status]] = now
+    if status == Demo.BUILDING:
+        fields.setdefault('last_error', '')
+
+    demos = Demo.objects.filter(url=demo_url)
+    if isinstance(from_status, str):
+        from_status = [from_status]
+    if from_status:
+        demos = demos.filter(status__in=from_status)
+    updated = demos.update(**fields)
+    if updated:
+        _publish_status(demo_url, status, fields.get('last_error', ''))
+        queue_route_update()
+    return updated
+
+
+def is_demo_cancelled(demo_url):
+    """Whether the demo was stopped while it was queued or building"""
+    return Demo.objects.filter(
+        url=demo_url,
+        status__in=CANCELLED_STATUSES,
+    ).exists()
+
+
+def cancel_demo_start(demo_url):
+    """Revoke the start task of a demo that is being stopped.
+
+    A start still waiting in the scheduler is removed, one in the Celery
+    queue is dropped by the workers. One that is already building notices
+    through is_demo_cancelled and aborts.
+    """
+    PendingStart.objects.filter(demo_url=demo_url).delete()
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return
+
+    from demoservice.tasks import app
+
+    task_id = (
+        Demo.objects.filter(url=demo_url)
+        .values_list('start_task_id', flat=True)
+        .first()
+    )
+    if task_id:
+        app.control.revoke(task_id)
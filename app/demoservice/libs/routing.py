@@ -0,0 +1,165 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from django.conf import settings
+from django.db import transaction
+from demoservice.libs.nodes import get_docker_host_address
+from demoservice.models import Demo
+
+ROUTED_STATUSES = [Demo.RUNNING, Demo.READY]
+DEMO_PRIORITY = 10
+PLACEHOLDER_PRIORITY = 1
+PLACEHOLDER_RULE = 'HostRegexp:{demo:.+}.run.demo.haus'
+
+# With DEMO_ROUTING_PROVIDER set to "file", the routes of the demos are
+# pushed to Traefik through its file provider every time a demo changes
+# status, instead of Traefik polling the Docker daemon for labels.
+
+
+def _get_route_name(demo_url):
+    # Route names are bare TOML keys
+    return re.sub(r'[^A-Za-z0-9_-]', '-', demo_url)
+
+
+def get_demo_routes():
+    """The routes to every demo that has a container serving it"""
+    demos = (
+        Demo.objects.filter(status__in=ROUTED_STATUSES, port__isnull=False)
+        .select_related('node')
+        .order_by('url')
+    )
+    local_host = settings.DEMO_ROUTING_HOST or get_docker_host_address()
+    routes = []
+    for demo in demos:
+        host = local_host
+        if demo.node:
+            host = demo.node.address
+        routes.append({
+            'name': _get_route_name(demo.url),
+            'rule': 'Host:{}'.format(demo.url),
+            'url': 'http://{host}:{port}'.format(host=host, port=demo.port),
+            'priority': DEMO_PRIORITY,
+        })
+
+    if settings.DEMO_ROUTING_PLACEHOLDER_URL:
+        routes.append({
+            'name': 'placeholder',
+            'rule': PLACEHOLDER_RULE,
+            'url': settings.DEMO_ROUTING_PLACEHOLDER_URL,
+            'priority': PLACEHOLDER_PRIORITY,
+        })
+    return routes
+
+
+def render_routing_config(routes):
+    """Traefik file provider configuration for the given routes"""
+    lines = ['[backends]']
+    for route in routes:
+        lines += [
+            '  [backends.{name}.servers.demo]'.format(**route),
+            '  url = {}'.format(json.dumps(route['url'])),
+        ]
+    lines.append('[frontends]')
+    for route in routes:
+        lines += [
+            '  [frontends.{name}]'.format(**route),
+            '  backend = {}'.format(json.dumps(route['name'])),
+            '  priority = {}'.format(route['priority']),
+            '  passHostHeader = true',
+            '    [frontends.{name}.routes.host]'.format(**route),
+            '    rule = {}'.format(json.dumps(route['rule'])),
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def write_routing_config():
+    """Replace the routing file with the current routes in one step.
+
+    Traefik only ever sees a complete file: it is written next to the
+    final one and renamed over it.
+    """
+    path = settings.DEMO_ROUTING_FILE
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    # Without the lock a slow writer could put back routes that are gone
+    with open(path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        config = render_routing_config(get_demo_routes())
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory,
+            prefix='.routes-',
+            suffix='.tmp',
+        )
+        try:
+            with os.fdopen(fd, 'w') as tmp_file:
+                tmp_file.write(config)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+def _is_written_since(timestamp):
+    try:
+        return os.path.getmtime(settings.DEMO_ROUTING_FILE) >= timestamp
+    except OSError:
+        return False
+
+
+def update_routes(since=None):
+    """Push the routes to Traefik, if it is configured to read them.
+
+    Routing is best effort, the next status change or registry sync
+    writes the file again. With since, a file written after that time is
+    left alone, as it already has the latest routes. Returns whether the
+    file was written.
+    """
+    if settings.DEMO_ROUTING_PROVIDER != 'file':
+        return False
+    if since and _is_written_since(since):
+        return False
+
+    try:
+        write_routing_config()
+    except Exception as e:
+        logging.getLogger(__name__).error(
+            'Could not write the routing config: %s', e
+        )
+        return False
+    return True
+
+
+def queue_route_update():
+    """Have a worker push the routes once the current transaction commits.
+
+    Only the workers mount the routing folder, so the web, forwarder and
+    watchdog processes don't write it themselves. The update runs
+    DEMO_ROUTING_DELAY seconds later, and updates queued before a write
+    started are covered by it, so a burst of status changes is written
+    once.
+    """
+    from demoservice.tasks.routing import update_routes_task
+
+    if settings.DEMO_ROUTING_PROVIDER != 'file':
+        return
+    logger = logging.getLogger(__name__)
+    delay = settings.DEMO_ROUTING_DELAY
+
+    def queue():
+        try:
+            update_routes_task.apply_async(
+                kwargs={'since': time.time() + delay},
+                countdown=delay,
+            )
+        except Exception as e:
+            logger.error('Could not queue a routing update: %s', e)
+
+    transaction.on_commit(queue)
@@ -0,0 +1,203 @@
+import json
+import logging
+from collections import Counter, OrderedDict, deque
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from demoservice.libs.diskusage import make_disk_room
+from demoservice.models import Demo, PendingStart
+
+IN_FLIGHT_STATUSES = [Demo.QUEUED, Demo.BUILDING]
+
+# Demo starts don't go to Celery straight away. They wait in one queue per
+# repository and are handed to the workers a few at a time, so a single
+# busy repository can't hold up the demos of every other one.
+
+
+def _parse_shares(values, cast):
+    """Parse a list of "key=value" settings into a dict"""
+    shares = {}
+    for value in values:
+        key, _, share = value.partition('=')
+        shares[key] = cast(share)
+    return shares
+
+
+def _get_share(shares, user, repo, default):
+    """A repository's share, falling back to its organisation's"""
+    key = '/'.join([user, repo])
+    return shares.get(key, shares.get(user, default))
+
+
+def get_repo_weight(user, repo):
+    weights = _parse_shares(settings.DEMO_SCHEDULER_WEIGHTS, float)
+    # Weights divide the number of starts in flight, so keep them positive
+    return max(_get_share(weights, user, repo, 1.0), 0.01)
+
+
+def get_repo_concurrency(user, repo):
+    concurrency = _parse_shares(settings.DEMO_SCHEDULER_CONCURRENCY, int)
+    return _get_share(
+        concurrency,
+        user,
+        repo,
+        settings.DEMO_SCHEDULER_DEFAULT_CONCURRENCY,
+    )
+
+
+def enqueue_start(
+    demo_url,
+    vcs_provider,
+    user,
+    repo,
+    options,
+    countdown=None,
+    held=False,
+):
+    """Add a start to its repository's queue.
+
+    A demo has at most one pending start, a new push replaces the options
+    of a start that is still waiting but keeps its place in the queue.
+    Held starts are not dispatched until they are released by wake_demo.
+    """
+    not_before = None
+    if countdown:
+        not_before = timezone.now() + timedelta(seconds=countdown)
+    PendingStart.objects.update_or_create(
+        demo_url=demo_url,
+        defaults={
+            'vcs_provider': vcs_provider,
+            'user': user,
+            'repo': repo,
+            'options': json.dumps(options),
+            'not_before': not_before,
+            'held': held,
+        },
+    )
+
+
+def pick_starts(pending, in_flight, slots):
+    """Choose up to slots starts from the pending ones.
+
+    Each turn goes to the repository with the fewest starts in flight for
+    its weight, skipping repositories at their concurrency cap. Ties go to
+    the repository that has been waiting the longest.
+    """
+    in_flight = Counter(in_flight)
+    queues = OrderedDict()
+    for start in pending:
+        key = (start.user, start.repo)
+        queues.setdefault(key, deque()).append(start)
+
+    picked = []
+    while len(picked) < slots:
+        candidates = [
+            key for key, starts in queues.items()
+            if starts and in_flight[key] < get_repo_concurrency(*key)
+        ]
+        if not candidates:
+            break
+        key = min(
+            candidates,
+            key=lambda key: (
+                in_flight[key] / get_repo_weight(*key),
+                queues[key][0].created_at,
+            ),
+        )
+        picked.append(queues[key].popleft())
+        in_flight[key] += 1
+    return picked
+
+
+def requeue_start(start):
+    """Put a start that could not be dispatched back in its old place"""
+    # A start cancelled in the meantime stays cancelled
+    if not Demo.objects.filter(
+        url=start.demo_url, status=Demo.QUEUED
+    ).exists():
+        return False
+
+    # A newer push has queued its own options already
+    pending, _ = PendingStart.objects.get_or_create(
+        demo_url=start.demo_url,
+        defaults={
+            'vcs_provider': start.vcs_provider,
+            'user': start.user,
+            'repo': start.repo,
+            'options': start.options,
+        },
+    )
+    PendingStart.objects.filter(id=pending.id).update(
+        created_at=start.created_at
+    )
+    return True
+
+
+def _apply_start(start):
+    from demoservice.tasks.github import apply_start_demo
+    from demoservice.tasks.launchpad import apply_start_launchpad_demo
+
+    logger = logging.getLogger(__name__)
+    options = json.loads(start.options)
+    try:
+        if start.vcs_provider == Demo.LAUNCHPAD:
+            apply_start_launchpad_demo(**options)
+        else:
+            apply_start_demo(**options)
+    except Exception as e:
+        # Most likely the broker, the next dispatch tries again
+        logger.error('Could not dispatch start of %s: %s', start.demo_url, e)
+        requeue_start(start)
+
+
+def dispatch_starts():
+    """Hand the next pending starts to Celery, in fair-share order.
+
+    At most DEMO_SCHEDULER_MAX_IN_FLIGHT starts are queued or building at
+    any time, and none while the checkouts are over the disk high-water
+    mark. Returns the number of dispatched starts.
+    """
+    logger = logging.getLogger(__name__)
+    if not make_disk_room():
+        logger.warning('Demo checkouts are over the disk high-water mark')
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Locking the pending starts keeps concurrent dispatchers in line
+        pending = list(
+            PendingStart.objects.filter(held=False).select_for_update()
+        )
+        pending_urls = [start.demo_url for start in pending]
+
+        # Starts that were lost along the way stop counting after a while
+        since = now - timedelta(seconds=settings.DEMO_SCHEDULER_STALE_AFTER)
+        in_flight = Counter(
+            Demo.objects.filter(
+                status__in=IN_FLIGHT_STATUSES,
+                updated_at__gte=since,
+            )
+            .exclude(url__in=pending_urls)
+            .values_list('user', 'repo')
+        )
+
+        ready = [
+            start for start in pending
+            if not start.not_before or start.not_before <= now
+        ]
+        slots = settings.DEMO_SCHEDULER_MAX_IN_FLIGHT - sum(
+            in_flight.values()
+        )
+        starts = pick_starts(ready, in_flight, slots)
+
+        # Taken out of the queue so no other dispatcher picks them, a start
+        # the broker doesn't take is put back
+        PendingStart.objects.filter(
+            id__in=[start.id for start in starts]
+        ).delete()
+        for start in starts:
+            logger.info('Dispatching start of %s', start.demo_url)
+            transaction.on_commit(partial(_apply_start, start))
+    return len(starts)
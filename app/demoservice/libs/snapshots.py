@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from demoservice.libs.nodes import get_demo_node, get_docker_client
+from demoservice.libs.registry import set_demo_status
+from demoservice.models import Demo
+
+RESUMABLE_STATUSES = [Demo.RUNNING, Demo.READY, Demo.FAILED]
+
+
+def _get_container_snapshot(container):
+    config = container.attrs['Config']
+    host_config = container.attrs['HostConfig']
+    # Ports Docker picked are only in the network settings
+    ports = container.attrs['NetworkSettings']['Ports']
+    return {
+        'name': container.name,
+        'image': config['Image'],
+        'command': config['Cmd'],
+        'entrypoint': config['Entrypoint'],
+        'environment': config['Env'],
+        'labels': config['Labels'],
+        'working_dir': config['WorkingDir'],
+        'user': config['User'],
+        'ports': ports or host_config['PortBindings'] or {},
+        'volumes': host_config['Binds'] or [],
+        'network_mode': host_config['NetworkMode'],
+    }
+
+
+def snapshot_demo(demo_url):
+    """Save what is needed to recreate the containers of a running demo.
+
+    Called once a demo has started. The snapshot is best effort, a demo
+    without one is simply rebuilt instead of resumed.
+    """
+    logger = logging.getLogger(__name__)
+    try:
+        client = get_docker_client(get_demo_node(demo_url))
+        containers = client.containers.list(
+            filters={
+                'label': 'run.demo.url={url}'.format(url=demo_url),
+            }
+        )
+        snapshot = [_get_container_snapshot(c) for c in containers]
+    except Exception as e:
+        logger.warning('Could not snapshot %s: %s', demo_url, e)
+        return False
+
+    Demo.objects.filter(url=demo_url).update(snapshot=json.dumps(snapshot))
+    return True
+
+
+def _check_volumes(volumes):
+    # Docker would create missing bind sources as empty directories
+    for volume in volumes:
+        source = volume.split(':')[0]
+        if source.startswith(settings.DEMO_DIR) and not os.path.exists(
+            source
+        ):
+            raise Exception('{} no longer exists'.format(source))
+
+
+def _resume_container(client, snapshot):
+    from docker.errors import APIError, NotFound
+
+    try:
+        container = client.containers.get(snapshot['name'])
+    except NotFound:
+        container = None
+
+    if container:
+        if container.status == 'running':
+            return False
+        container.start()
+        return True
+
+    _check_volumes(snapshot['volumes'])
+    try:
+        _run_container(client, snapshot)
+    except APIError as e:
+        # Another worker got to it first
+        if e.status_code == 409:
+            return False
+        raise
+    return True
+
+
+def _run_container(client, snapshot):
+    ports = {
+        port: int(bindings[0]['HostPort'])
+        for port, bindings in snapshot['ports'].items()
+        if bindings
+    }
+    client.containers.run(
+        snapshot['image'],
+        snapshot['command'],
+        name=snapshot['name'],
+        entrypoint=snapshot['entrypoint'],
+        environment=snapshot['environment'],
+        labels=snapshot['labels'],
+        working_dir=snapshot['working_dir'],
+        user=snapshot['user'],
+        ports=ports,
+        volumes=snapshot['volumes'],
+        network_mode=snapshot['network_mode'],
+        detach=True,
+    )
+
+
+def resume_demo(demo):
+    """Bring back the containers of a demo from its snapshot.
+
+    Nothing is cloned, installed or built: stopped containers are started
+    again and missing ones are recreated from their image and checkout.
+    """
+    from demoservice.tasks.readiness import wait_for_demo_task
+
+    logger = logging.getLogger(__name__)
+    try:
+        client = get_docker_client(demo.node)
+        resumed = [
+            _resume_container(client, snapshot)
+            for snapshot in json.loads(demo.snapshot)
+        ]
+    except Exception as e:
+        logger.error('Could not resume %s: %s', demo.url, e)
+        set_demo_status(
+            demo.url,
+            Demo.FAILED,
+            from_status=RESUMABLE_STATUSES,
+            last_error='Could not resume demo: {}'.format(e),
+        )
+        return False
+
+    if not any(resumed):
+        logger.debug('%s is still running', demo.url)
+        return False
+
+    logger.info('Resumed %s', demo.url)
+    set_demo_status(
+        demo.url,
+        Demo.RUNNING,
+        from_status=RESUMABLE_STATUSES,
+        last_error='',
+    )
+    wait_for_demo_task.delay(
+        None,
+        demo_url=demo.url,
+        context={},
+        record_timing=False,
+    )
+    return True
+
+
+def _resume_demo_in_thread(demo):
+    try:
+        return resume_demo(demo)
+    finally:
+        # Every thread opens a database connection of its own
+        connection.close()
+
+
+def resume_demos(progress=None):
+    """Resume every demo that should be running but isn't.
+
+    DEMO_RESUME_WORKERS demos are resumed at the same time. Returns the
+    number of resumed demos.
+    """
+    if progress is None:
+        progress = logging.getLogger(__name__).info
+
+    demos = list(
+        Demo.objects.filter(status__in=RESUMABLE_STATUSES)
+        .exclude(snapshot='')
+        .select_related('node')
+    )
+    progress('Checking {} demos'.format(len(demos)))
+    with ThreadPoolExecutor(settings.DEMO_RESUME_WORKERS) as executor:
+        resumed = sum(executor.map(_resume_demo_in_thread, demos))
+
+    progress('Resumed {} demos'.format(resumed))
+    return resumed
@@ -0,0 +1,174 @@
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.db import InterfaceError, close_old_connections
+from django.db import OperationalError as DatabaseError
+from kombu.exceptions import OperationalError as BrokerError
+
+# Webhooks are appended to a SQLite file local to the web container, which
+# takes a fraction of a millisecond, and answered straight away. The
+# forwarder hands them to the handlers, and so to the broker, in the order
+# they arrived. A broker outage only delays them.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS webhooks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    provider TEXT NOT NULL,
+    event TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT NOT NULL DEFAULT ''
+)
+'''
+GITHUB = 'github'
+LAUNCHPAD = 'launchpad'
+# Failures that go away once the broker or the database is back. Anything
+# else would fail the same way every time.
+TRANSIENT_ERRORS = (BrokerError, DatabaseError, InterfaceError, OSError)
+
+_connections = threading.local()
+
+
+def _get_connection():
+    """The calling thread's connection to the spool"""
+    path = settings.DEMO_WEBHOOK_SPOOL
+    connection = getattr(_connections, 'connection', None)
+    if getattr(_connections, 'path', None) != path:
+        connection = None
+    if connection is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit, each webhook is a transaction of its own
+        connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        # In WAL mode a commit survives the process dying and appending
+        # doesn't wait for the forwarder
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(SCHEMA)
+        _connections.connection = connection
+        _connections.path = path
+    return connection
+
+
+def spool_webhook(provider, event, payload):
+    """Save a webhook for the forwarder"""
+    _get_connection().execute(
+        'INSERT INTO webhooks (provider, event, payload, received_at) '
+        'VALUES (?, ?, ?, ?)',
+        (provider, event, json.dumps(payload), time.time()),
+    )
+
+
+def _handle(provider, event, payload):
+    from demoservice.libs.github import handle_webhook
+    from demoservice.libs.launchpad import (
+        handle_webhook as handle_launchpad_webhook
+    )
+
+    if provider == LAUNCHPAD:
+        handle_launchpad_webhook(event, payload)
+    else:
+        handle_webhook(event, payload)
+
+
+def get_retry_delay(attempts):
+    return min(2 ** attempts, settings.DEMO_WEBHOOK_SPOOL_MAX_BACKOFF)
+
+
+def is_transient_error(error):
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def forward_webhooks():
+    """Hand the next batch of spooled webhooks to their handlers.
+
+    Webhooks are forwarded oldest first. When the broker or the database
+    can't be reached the batch stops, so a closed PR is never handled
+    before it was opened, and the webhook is retried with a growing delay
+    until DEMO_WEBHOOK_SPOOL_MAX_ATTEMPTS. Any other error is down to the
+    webhook itself, which is set aside straight away. A webhook is only
+    removed once it has been handled, so one can be handled twice but
+    never lost. Returns the number of forwarded webhooks.
+    """
+    logger = logging.getLogger(__name__)
+    connection = _get_connection()
+    max_attempts = settings.DEMO_WEBHOOK_SPOOL_MAX_ATTEMPTS
+    rows = connection.execute(
+        'SELECT id, provider, event, payload, attempts, next_attempt_at '
+        'FROM webhooks WHERE attempts < ? ORDER BY id LIMIT ?',
+        (max_attempts, settings.DEMO_WEBHOOK_SPOOL_BATCH_SIZE),
+    ).fetchall()
+
+    forwarded = []
+    now = time.time()
+    for row in rows:
+        webhook_id, provider, event, payload, attempts, next_attempt_at = row
+        if next_attempt_at > now:
+            break
+        try:
+            _handle(provider, event, json.loads(payload))
+        except Exception as e:
+            transient = is_transient_error(e)
+            attempts = attempts + 1 if transient else max_attempts
+            if attempts >= max_attempts:
+                logger.error(
+                    'Giving up on %s webhook %s: %s', provider, webhook_id, e
+                )
+            else:
+                logger.warning(
+                    'Could not forward %s webhook %s: %s',
+                    provider,
+                    webhook_id,
+                    e,
+                )
+            connection.execute(
+                'UPDATE webhooks SET attempts = ?, next_attempt_at = ?, '
+                'last_error = ? WHERE id = ?',
+                (
+                    attempts,
+                    now + get_retry_delay(attempts),
+                    str(e),
+                    webhook_id,
+                ),
+            )
+            if transient:
+                break
+            continue
+        forwarded.append(webhook_id)
+
+    if forwarded:
+        # One statement, so the whole batch is removed in one commit
+        connection.execute(
+            'DELETE FROM webhooks WHERE id IN ({})'.format(
+                ', '.join('?' * len(forwarded))
+            ),
+            forwarded,
+        )
+    return len(forwarded)
+
+
+def run_forwarder(poll_interval=None):
+    """Forward spooled webhooks as they come in, forever"""
+    logger = logging.getLogger(__name__)
+    if poll_interval is None:
+        poll_interval = settings.DEMO_WEBHOOK_SPOOL_POLL_INTERVAL
+
+    # A second forwarder on the same spool would handle webhooks twice
+    _get_connection()
+    with open(settings.DEMO_WEBHOOK_SPOOL + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        while True:
+            # The handlers use the database, which may have gone away
+            close_old_connections()
+            try:
+                forwarded = forward_webhooks()
+            except Exception as e:
+                logger.error('Could not read the webhook spool: %s', e)
+                forwarded = 0
+            if forwarded < settings.DEMO_WEBHOOK_SPOOL_BATCH_SIZE:
+                time.sleep(poll_interval)
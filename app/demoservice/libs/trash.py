@@ -0,0 +1,68 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+from django.conf import settings
+
+
+def move_to_trash(path):
+    """Rename a demo directory into the trash area and return its new path.
+
+    The trash directory lives inside DEMO_DIR so this is a cheap rename on
+    the same filesystem; the actual deletion happens later in
+    remove_tree_throttled.
+    """
+    os.makedirs(settings.DEMO_TRASH_DIR, exist_ok=True)
+    trash_path = os.path.join(
+        settings.DEMO_TRASH_DIR,
+        '{name}-{suffix}'.format(
+            name=os.path.basename(os.path.normpath(path)),
+            suffix=uuid.uuid4().hex[:8],
+        ),
+    )
+    os.rename(path, trash_path)
+    return trash_path
+
+
+def _remove_entry(path, is_dir=False):
+    try:
+        if is_dir and not os.path.islink(path):
+            os.rmdir(path)
+        else:
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_tree_throttled(path, batch_size=None, pause=None):
+    """Delete a directory tree in small batches.
+
+    Pauses between batches so that removing a large checkout (node_modules
+    and friends) doesn't saturate disk I/O while other demos are building.
+    """
+    logger = logging.getLogger(__name__)
+    if batch_size is None:
+        batch_size = settings.DEMO_RECLAIM_BATCH_SIZE
+    if pause is None:
+        pause = settings.DEMO_RECLAIM_BATCH_PAUSE
+
+    if not os.path.lexists(path):
+        return 0
+
+    removed = 0
+    for root, dirs, files in os.walk(path, topdown=False):
+        entries = [(name, False) for name in files]
+        entries += [(name, True) for name in dirs]
+        for name, is_dir in entries:
+            try:
+                _remove_entry(os.path.join(root, name), is_dir=is_dir)
+            except OSError as e:
+                logger.warning('Could not remove %s: %s', name, e)
+            removed += 1
+            if pause and removed % batch_size == 0:
+                time.sleep(pause)
+
+    # Anything left behind (permissions, races) is removed in one go
+    shutil.rmtree(path, ignore_errors=True)
+    return removed
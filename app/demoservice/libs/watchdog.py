@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from demoservice.libs.nodes import get_docker_client, get_nodes
+from demoservice.libs.registry import set_demo_status
+from demoservice.models import Demo, DemoIncident
+
+LIVE_STATUSES = [Demo.RUNNING, Demo.READY]
+RESTART_ACTIONS = [
+    DemoIncident.SCHEDULED,
+    DemoIncident.RESTARTED,
+    DemoIncident.RESTART_FAILED,
+]
+
+# Demo containers that die on their own are started again as they are,
+# nothing is rebuilt. Restarts back off exponentially, and a demo that
+# keeps crashing is left failed.
+
+
+def get_restart_delay(restarts):
+    return min(
+        settings.DEMO_WATCHDOG_BACKOFF * 2 ** restarts,
+        settings.DEMO_WATCHDOG_MAX_BACKOFF,
+    )
+
+
+def _is_watched(demo, since):
+    if demo.status in LIVE_STATUSES:
+        return True
+    # Another container of the demo crashed first
+    return demo.status == Demo.FAILED and DemoIncident.objects.filter(
+        demo_url=demo.url,
+        created_at__gte=since,
+        action__in=RESTART_ACTIONS,
+    ).exists()
+
+
+def handle_container_death(node, demo_url, container_name, event, exit_code):
+    """Record a demo container that stopped and schedule its restart.
+
+    Containers of demos that are being stopped or rebuilt are left alone.
+    Returns the incident, or None if there was nothing to do.
+    """
+    from demoservice.tasks.watchdog import restart_container_task
+
+    logger = logging.getLogger(__name__)
+    demo = Demo.objects.filter(url=demo_url).first()
+    since = timezone.now() - timedelta(
+        seconds=settings.DEMO_WATCHDOG_CRASH_WINDOW
+    )
+    if not demo or not _is_watched(demo, since):
+        return None
+
+    restarts = DemoIncident.objects.filter(
+        demo_url=demo_url,
+        created_at__gte=since,
+        action__in=RESTART_ACTIONS,
+    ).count()
+    action = DemoIncident.SCHEDULED
+    last_error = 'Container {name} stopped ({event}, exit code {code})'
+    if restarts >= settings.DEMO_WATCHDOG_MAX_RESTARTS:
+        action = DemoIncident.GAVE_UP
+        last_error = 'Container {name} keeps crashing, not restarting it'
+
+    incident = DemoIncident.objects.create(
+        demo_url=demo_url,
+        node=node,
+        container_name=container_name,
+        event=event,
+        exit_code=exit_code,
+        action=action,
+    )
+    set_demo_status(
+        demo_url,
+        Demo.FAILED,
+        from_status=LIVE_STATUSES,
+        last_error=last_error.format(
+            name=container_name,
+            event=event,
+            code=exit_code,
+        ),
+    )
+    if action == DemoIncident.GAVE_UP:
+        logger.error('%s is crash looping, giving up', container_name)
+        return incident
+
+    delay = get_restart_delay(restarts)
+    logger.warning('Restarting %s in %ss', container_name, delay)
+    restart_container_task.apply_async(
+        kwargs={'incident_id': incident.id},
+        countdown=delay,
+    )
+    return incident
+
+
+def restart_container(incident_id):
+    """Start the container of an incident again, as it was"""
+    from demoservice.tasks.readiness import wait_for_demo_task
+
+    incident = DemoIncident.objects.select_related('node').get(
+        id=incident_id
+    )
+    demo = Demo.objects.filter(url=incident.demo_url).first()
+    if not demo or demo.status != Demo.FAILED:
+        # Stopped, rebuilt or brought back some other way
+        incident.action = DemoIncident.SKIPPED
+        incident.save(update_fields=['action'])
+        return False
+
+    try:
+        client = get_docker_client(incident.node)
+        client.containers.get(incident.container_name).start()
+    except Exception as e:
+        incident.action = DemoIncident.RESTART_FAILED
+        incident.error = str(e)
+        incident.save(update_fields=['action', 'error'])
+        return False
+
+    incident.action = DemoIncident.RESTARTED
+    incident.save(update_fields=['action'])
+    set_demo_status(
+        incident.demo_url,
+        Demo.RUNNING,
+        from_status=Demo.FAILED,
+        last_error='',
+    )
+    wait_for_demo_task.delay(
+        None,
+        demo_url=incident.demo_url,
+        context={},
+        record_timing=False,
+    )
+    return True
+
+
+def _handle_event(node, event, oom_killed):
+    attributes = event['Actor']['Attributes']
+    container_name = attributes.get('name', event['id'])
+    if event['Action'] == 'oom':
+        # Docker reports the out of memory kill before the container dies
+        oom_killed.add(event['id'])
+        return
+
+    exit_code = int(attributes.get('exitCode', -1))
+    event_name = 'die'
+    if event['id'] in oom_killed:
+        oom_killed.discard(event['id'])
+        event_name = 'oom'
+    elif exit_code == 0:
+        return
+    handle_container_death(
+        node,
+        attributes.get('run.demo.url', ''),
+        container_name,
+        event_name,
+        exit_code,
+    )
+
+
+def watch_node(node, stop=None):
+    """Handle the deaths of demo containers on a node until stop is set.
+
+    Events are read in windows of DEMO_WATCHDOG_POLL_INTERVAL seconds, so
+    the stream never hits the Docker client timeout, and a window is read
+    again if the connection fails.
+    """
+    logger = logging.getLogger(__name__)
+    name = node.name if node else 'local'
+    stop = stop or threading.Event()
+    since = int(time.time())
+    last_event = 0
+    oom_killed = set()
+    while not stop.is_set():
+        until = int(time.time()) + settings.DEMO_WATCHDOG_POLL_INTERVAL
+        try:
+            client = get_docker_client(node)
+            events = client.events(
+                since=since,
+                until=until,
+                filters={
+                    'type': 'container',
+                    'event': ['die', 'oom'],
+                    'label': 'run.demo',
+                },
+                decode=True,
+            )
+            for event in events:
+                # Windows overlap by a second
+                if event['timeNano'] <= last_event:
+                    continue
+                last_event = event['timeNano']
+                _handle_event(node, event, oom_killed)
+            since = until
+        except Exception as e:
+            logger.error('Watching Docker events on %s failed: %s', name, e)
+            # The database may have gone away as well
+            connection.close()
+            time.sleep(5)
+
+
+def _start_watcher(node, stop):
+    thread = threading.Thread(
+        target=watch_node,
+        args=(node, stop),
+        name='watch-{}'.format(node.name if node else 'local'),
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def refresh_watchers(watchers, start_watcher=_start_watcher):
+    """Bring the event watchers in line with the registered nodes.
+
+    watchers maps each watched engine, by node ID and Docker URL, to its
+    thread and stop event. New nodes get a watcher, watchers that died are
+    started again and the watchers of removed nodes are stopped.
+    """
+    logger = logging.getLogger(__name__)
+    nodes = {
+        (node.pk, node.docker_url) if node else (None, None): node
+        for node in get_nodes()
+    }
+    for key in set(watchers) - set(nodes):
+        logger.info('No longer watching %s', key[1] or 'local')
+        thread, stop = watchers.pop(key)
+        stop.set()
+
+    for key, node in nodes.items():
+        watcher = watchers.get(key)
+        if watcher and watcher[0].is_alive():
+            continue
+        if watcher:
+            logger.warning('Restarting the watcher of %s', key[1] or 'local')
+        stop = threading.Event()
+        watchers[key] = (start_watcher(node, stop), stop)
+    return watchers
+
+
+def watch_nodes():
+    """Watch every node, forever.
+
+    The nodes are read again every DEMO_WATCHDOG_NODES_INTERVAL seconds so
+    that nodes registered later are watched too.
+    """
+    logger = logging.getLogger(__name__)
+    watchers = {}
+    while True:
+        try:
+            refresh_watchers(watchers)
+        except Exception as e:
+            logger.error('Could not refresh the node watchers: %s', e)
+            connection.close()
+        time.sleep(settings.DEMO_WATCHDOG_NODES_INTERVAL)
@@ -0,0 +1,119 @@
+import fcntl
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from django.conf import settings
+from demoservice.libs.trash import move_to_trash, remove_tree_throttled
+
+CLONE = 'clone'
+REFLINK = 'reflink'
+
+
+def _get_base_path(clone_url):
+    url = urlsplit(clone_url)
+    return os.path.join(
+        settings.DEMO_BASE_DIR,
+        url.netloc,
+        url.path.strip('/'),
+    )
+
+
+def _update_base_tree(clone_url, base_path, logger, build_log):
+    if not os.path.isdir(base_path):
+        logger.info('Cloning base tree: %s', clone_url)
+        return_code = build_log.run(['git', 'clone', clone_url, base_path])
+    else:
+        logger.info('Fetching base tree: %s', clone_url)
+        return_code = build_log.run(
+            ['git', 'fetch', '--prune', 'origin'],
+            cwd=base_path,
+        )
+    return return_code == 0
+
+
+def _copy_base_tree(clone_url, local_path, logger, build_log):
+    """Make a reflink copy of the repository's base tree.
+
+    Only the blocks that the demo changes later on take up disk space. The
+    base tree is locked while it is fetched and copied so concurrent starts
+    of the same repository never copy a half updated tree.
+    """
+    base_path = _get_base_path(clone_url)
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+
+    with open(base_path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not _update_base_tree(clone_url, base_path, logger, build_log):
+            logger.error('Error while updating base tree %s', base_path)
+            return False
+
+        return_code = build_log.run(
+            ['cp', '-a', '--reflink=always', base_path, local_path]
+        )
+        if return_code > 0:
+            logger.warning('Reflink copy of %s failed', base_path)
+            shutil.rmtree(local_path, ignore_errors=True)
+            return False
+    return True
+
+
+def create_worktree(clone_url, local_path, logger, build_log):
+    """Create the working tree of a new demo at local_path.
+
+    Depending on DEMO_STORAGE_MODE this is a plain clone or a copy-on-write
+    copy of a per-repository base tree. Falls back to cloning if the copy
+    fails, for example on a filesystem without reflink support. The output
+    of the commands goes to the demo's build log.
+    """
+    if settings.DEMO_STORAGE_MODE == REFLINK:
+        if _copy_base_tree(clone_url, local_path, logger, build_log):
+            return True
+        logger.info('Falling back to a full clone')
+
+    logger.info('Cloning git repo: %s', clone_url)
+    return build_log.run(['git', 'clone', clone_url, local_path]) == 0
+
+
+def stage_worktree(fetch, authorize, local_path, logger):
+    """Fetch the working tree of a new demo while its start is authorized.
+
+    fetch(path) fetches the sources into a staging directory, it must not
+    run anything from them. authorize() runs in a thread at the same time
+    and returns None if the start is allowed, or why it isn't. The staged
+    tree is only moved to local_path once the start is allowed, otherwise
+    it is thrown away. With DEMO_SPECULATIVE_START off, nothing is fetched
+    before the start is allowed.
+
+    Returns why the start isn't allowed, or None, and whether the tree
+    was fetched.
+    """
+    staging_path = os.path.join(
+        settings.DEMO_STAGING_DIR,
+        '{name}-{suffix}'.format(
+            name=os.path.basename(local_path),
+            suffix=uuid.uuid4().hex[:8],
+        ),
+    )
+    os.makedirs(settings.DEMO_STAGING_DIR, exist_ok=True)
+
+    promoted = False
+    try:
+        if settings.DEMO_SPECULATIVE_START:
+            with ThreadPoolExecutor(1) as executor:
+                authorizing = executor.submit(authorize)
+                fetched = fetch(staging_path)
+                reason = authorizing.result()
+        else:
+            reason = authorize()
+            fetched = reason is None and fetch(staging_path)
+
+        if reason is None and fetched:
+            os.rename(staging_path, local_path)
+            promoted = True
+        return reason, fetched
+    finally:
+        if not promoted and os.path.exists(staging_path):
+            logger.info('Discarding staged tree %s', staging_path)
+            remove_tree_throttled(move_to_trash(staging_path))
@@ -1,4 +1,14 @@
+import copy
 import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from django.utils.module_loading import import_string
+
+# Handlers with a shipper thread, to flush when a worker process exits
+_shipping_handlers = weakref.WeakSet()
 
 
 def get_demo_logger(
@@ -16,3 +26,136 @@ def get_demo_logger(
     }
     logger = logging.getLogger(logger_name)
     return logging.LoggerAdapter(logger, extra)
+
+
+class QueueShippingHandler(logging.Handler):
+    """Ship records through another handler from a background thread.
+
+    Logging calls only put the record on a bounded queue, so a slow log
+    server never holds up a request or a task. When the queue is full the
+    record is dropped and counted instead. Each process starts its own
+    shipper thread the first time it logs, as threads don't survive the
+    fork of Celery and gunicorn workers.
+    """
+
+    def __init__(
+        self,
+        target_class,
+        queue_size=10000,
+        batch_size=100,
+        flush_interval=1.0,
+        flush_timeout=5.0,
+        **target_options
+    ):
+        super().__init__()
+        self.target = import_string(target_class)(**target_options)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_timeout = flush_timeout
+        self.dropped = 0
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        _shipping_handlers.add(self)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def _ensure_shipper(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._thread = threading.Thread(
+                target=self._ship,
+                args=(self._queue,),
+                name='log-shipper',
+                daemon=True,
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def emit(self, record):
+        try:
+            self._ensure_shipper()
+            # Render the message now, the arguments may change later on
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _take_dropped(self):
+        with self._lock:
+            dropped = self.dropped
+            self.dropped = 0
+        return dropped
+
+    def _next_batch(self, records_queue):
+        batch = [records_queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(records_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _ship(self, records_queue):
+        while True:
+            batch = self._next_batch(records_queue)
+            received = len(batch)
+            dropped = self._take_dropped()
+            if dropped:
+                batch.append(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': 'Dropped %s log records, the log queue was full',
+                    'args': (dropped,),
+                }))
+            for record in batch:
+                if record is None:
+                    self.target.flush()
+                    return
+                self.target.handle(record)
+            self.target.flush()
+            for _ in range(received):
+                records_queue.task_done()
+
+    def flush(self):
+        """Wait, up to flush_timeout, for the queued records to be sent"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + self.flush_timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def close(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self.flush()
+            try:
+                self._queue.put(None, timeout=self.flush_timeout)
+            except queue.Full:
+                pass
+            self._thread.join(self.flush_timeout)
+        self.target.close()
+        _shipping_handlers.discard(self)
+        super().close()
+
+
+def flush_log_handlers():
+    """Send the queued records, for processes that exit without atexit"""
+    for handler in list(_shipping_handlers):
+        handler.flush()
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from demoservice.libs.backfill import backfill_demos
+
+
+class Command(BaseCommand):
+    help = 'Start demos for every open PR of the configured repositories'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'repos',
+            nargs='*',
+            help=(
+                'user/repo or lp:<repository path>, '
+                'defaults to DEMO_BACKFILL_REPOS'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the demos that would be started',
+        )
+
+    def handle(self, *args, **options):
+        repos = options['repos'] or settings.DEMO_BACKFILL_REPOS
+        if not repos:
+            raise CommandError('No repositories given or configured')
+
+        backfill_demos(
+            repos=repos,
+            dry_run=options['dry_run'],
+            progress=self.stdout.write,
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from demoservice.libs.spool import run_forwarder
+
+
+class Command(BaseCommand):
+    help = 'Hand the spooled webhooks to the broker as they come in'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Forwarding webhooks')
+        run_forwarder()
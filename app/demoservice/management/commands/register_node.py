@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from demoservice.models import Node
+
+
+class Command(BaseCommand):
+    help = 'Add or update a Docker engine that demos can be scheduled on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name')
+        parser.add_argument(
+            'docker_url', help='Ex: tcp://demos-2.internal:2375'
+        )
+        parser.add_argument(
+            '--address',
+            help='Host the demo ports are reachable on, defaults to the name',
+        )
+        parser.add_argument('--capacity', type=int, default=20)
+        parser.add_argument(
+            '--disable',
+            action='store_true',
+            help='Stop scheduling new demos on this node',
+        )
+
+    def handle(self, *args, **options):
+        node, created = Node.objects.update_or_create(
+            name=options['name'],
+            defaults={
+                'docker_url': options['docker_url'],
+                'address': options['address'] or options['name'],
+                'capacity': options['capacity'],
+                'enabled': not options['disable'],
+            },
+        )
+        action = 'Registered' if created else 'Updated'
+        self.stdout.write('{} node {}'.format(action, node.name))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from demoservice.libs.snapshots import resume_demos
+
+
+class Command(BaseCommand):
+    help = 'Bring back demos lost in a host or Docker restart'
+
+    def handle(self, *args, **options):
+        resume_demos(progress=self.stdout.write)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from demoservice.libs.watchdog import watch_nodes
+
+
+class Command(BaseCommand):
+    help = 'Restart demo containers that crash, on every node'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Watching the Docker engines of every node')
+        watch_nodes()
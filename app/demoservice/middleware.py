@@ -0,0 +1,67 @@
+import http
+import re
+from django.shortcuts import render
+from demoservice.libs.lazy import wake_demo
+from demoservice.libs.readiness import get_time_to_ready_by_repo
+from demoservice.models import Demo
+
+PLACEHOLDER_STATUSES = [
+    Demo.IDLE,
+    Demo.QUEUED,
+    Demo.BUILDING,
+    Demo.RUNNING,
+    Demo.FAILED,
+]
+# Link previews and crawlers must not build demos
+BOT_USER_AGENT_REGEX = re.compile(
+    r'bot|crawl|spider|preview|facebookexternalhit', re.IGNORECASE
+)
+
+
+def _is_visit(request):
+    """Whether a request comes from somebody opening the demo"""
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    return (
+        request.method == 'GET'
+        and 'text/html' in request.META.get('HTTP_ACCEPT', '')
+        and not BOT_USER_AGENT_REGEX.search(user_agent)
+    )
+
+
+class LazyDemoMiddleware:
+    """Placeholder for demos that are not being served yet.
+
+    Traefik sends requests for demo hosts without a container of their own
+    to the web service. The first visit of a lazy demo starts it, the page
+    then reloads itself until the demo takes over.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        host = request.get_host().split(':')[0]
+        demo = Demo.objects.filter(
+            url=host,
+            status__in=PLACEHOLDER_STATUSES,
+        ).first()
+        if not demo:
+            return self.get_response(request)
+
+        if demo.status == Demo.IDLE and _is_visit(request):
+            if wake_demo(demo.url):
+                demo.status = Demo.QUEUED
+
+        timing = get_time_to_ready_by_repo().filter(
+            user=demo.user,
+            repo=demo.repo,
+        ).first()
+        response = render(
+            request,
+            'demo_placeholder.html',
+            {'demo': demo, 'timing': timing},
+            status=http.HTTPStatus.SERVICE_UNAVAILABLE,
+        )
+        response['Retry-After'] = '5'
+        response['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0001_initial'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+                (
+                    'blocked_until',
+                    models.DateTimeField(blank=True, null=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0002_ratelimitbucket'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='Demo',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('url', models.CharField(max_length=255, unique=True)),
+                ('url_full', models.CharField(blank=True, max_length=255)),
+                (
+                    'vcs_provider',
+                    models.CharField(
+                        choices=[
+                            ('github', 'GitHub'),
+                            ('launchpad', 'Launchpad'),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ('user', models.CharField(max_length=100)),
+                ('repo', models.CharField(max_length=100)),
+                ('pr', models.CharField(blank=True, max_length=32)),
+                ('branch', models.CharField(blank=True, max_length=255)),
+                ('head_sha', models.CharField(blank=True, max_length=40)),
+                (
+                    'port',
+                    models.PositiveIntegerField(blank=True, null=True),
+                ),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('queued', 'Queued'),
+                            ('building', 'Building'),
+                            ('running', 'Running'),
+                            ('failed', 'Failed'),
+                            ('stopping', 'Stopping'),
+                            ('stopped', 'Stopped'),
+                        ],
+                        default='queued',
+                        max_length=16,
+                    ),
+                ),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('queued_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('stopped_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['url'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='demo',
+            index=models.Index(
+                fields=['status', 'url'],
+                name='demo_status_url_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='demo',
+            index=models.Index(
+                fields=['vcs_provider', 'user', 'repo', 'pr'],
+                name='demo_vcs_lookup_idx',
+            ),
+        ),
+    ]
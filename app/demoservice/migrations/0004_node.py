@@ -0,0 +1,59 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0003_demo'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='Node',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('name', models.CharField(max_length=100, unique=True)),
+                (
+                    'docker_url',
+                    models.CharField(
+                        help_text=(
+                            'Docker API URL, ex: tcp://demos-2.internal:2375'
+                        ),
+                        max_length=255,
+                    ),
+                ),
+                (
+                    'address',
+                    models.CharField(
+                        help_text=(
+                            'Host name or IP the demo ports are reachable on'
+                        ),
+                        max_length=255,
+                    ),
+                ),
+                ('capacity', models.PositiveIntegerField(default=20)),
+                ('enabled', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='demo',
+            name='node',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='demos',
+                to='demoservice.Node',
+            ),
+        ),
+    ]
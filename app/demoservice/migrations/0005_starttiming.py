@@ -0,0 +1,70 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0004_node'),
+    ]
+    operations = [
+        migrations.AlterField(
+            model_name='demo',
+            name='status',
+            field=models.CharField(
+                choices=[
+                    ('queued', 'Queued'),
+                    ('building', 'Building'),
+                    ('running', 'Starting up'),
+                    ('ready', 'Ready'),
+                    ('failed', 'Failed'),
+                    ('stopping', 'Stopping'),
+                    ('stopped', 'Stopped'),
+                ],
+                default='queued',
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name='demo',
+            name='running_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='StartTiming',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('demo_url', models.CharField(max_length=255)),
+                (
+                    'vcs_provider',
+                    models.CharField(
+                        choices=[
+                            ('github', 'GitHub'),
+                            ('launchpad', 'Launchpad'),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ('user', models.CharField(max_length=100)),
+                ('repo', models.CharField(max_length=100)),
+                ('build_seconds', models.FloatField(null=True)),
+                ('ready_seconds', models.FloatField(null=True)),
+                ('total_seconds', models.FloatField(null=True)),
+                ('is_ready', models.BooleanField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='starttiming',
+            index=models.Index(
+                fields=['user', 'repo', 'created_at'],
+                name='timing_repo_idx',
+            ),
+        ),
+    ]
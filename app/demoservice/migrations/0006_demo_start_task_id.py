@@ -0,0 +1,14 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0005_starttiming'),
+    ]
+    operations = [
+        migrations.AddField(
+            model_name='demo',
+            name='start_task_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
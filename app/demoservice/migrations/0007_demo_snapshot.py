@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0006_demo_start_task_id'),
+    ]
+    operations = [
+        migrations.AddField(
+            model_name='demo',
+            name='snapshot',
+            field=models.TextField(
+                blank=True,
+                help_text=(
+                    'JSON description of the containers, to resume the demo'
+                ),
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0007_demo_snapshot'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='BlobFact',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('repo', models.CharField(max_length=255)),
+                ('blob_sha', models.CharField(max_length=40)),
+                ('name', models.CharField(max_length=64)),
+                ('value', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('repo', 'blob_sha', 'name')},
+            },
+        ),
+    ]
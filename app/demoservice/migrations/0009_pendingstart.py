@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0008_blobfact'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='PendingStart',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('demo_url', models.CharField(max_length=255, unique=True)),
+                (
+                    'vcs_provider',
+                    models.CharField(
+                        choices=[
+                            ('github', 'GitHub'),
+                            ('launchpad', 'Launchpad'),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ('user', models.CharField(max_length=100)),
+                ('repo', models.CharField(max_length=100)),
+                (
+                    'options',
+                    models.TextField(help_text='JSON arguments of the start'),
+                ),
+                (
+                    'not_before',
+                    models.DateTimeField(blank=True, null=True),
+                ),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0009_pendingstart'),
+    ]
+    operations = [
+        migrations.AlterField(
+            model_name='demo',
+            name='status',
+            field=models.CharField(
+                choices=[
+                    ('idle', 'Waiting for a visit'),
+                    ('queued', 'Queued'),
+                    ('building', 'Building'),
+                    ('running', 'Starting up'),
+                    ('ready', 'Ready'),
+                    ('failed', 'Failed'),
+                    ('stopping', 'Stopping'),
+                    ('stopped', 'Stopped'),
+                ],
+                default='queued',
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name='pendingstart',
+            name='held',
+            field=models.BooleanField(
+                default=False,
+                help_text='Start of a lazy demo, waiting for its first visit',
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0010_lazy_demos'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='CachedImage',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('repo', models.CharField(max_length=255)),
+                ('source_hash', models.CharField(max_length=40)),
+                ('tag', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                (
+                    'node',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='cached_images',
+                        to='demoservice.Node',
+                    ),
+                ),
+            ],
+            options={
+                'unique_together': {('node', 'repo', 'source_hash')},
+            },
+        ),
+    ]
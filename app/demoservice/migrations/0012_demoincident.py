@@ -0,0 +1,70 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0011_cachedimage'),
+    ]
+    operations = [
+        migrations.CreateModel(
+            name='DemoIncident',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('demo_url', models.CharField(max_length=255)),
+                ('container_name', models.CharField(max_length=255)),
+                (
+                    'event',
+                    models.CharField(help_text='die or oom', max_length=16),
+                ),
+                ('exit_code', models.IntegerField(blank=True, null=True)),
+                (
+                    'action',
+                    models.CharField(
+                        choices=[
+                            ('scheduled', 'Restart scheduled'),
+                            ('restarted', 'Restarted'),
+                            ('restart_failed', 'Restart failed'),
+                            (
+                                'skipped',
+                                'Not restarted, the demo changed in the '
+                                'meantime',
+                            ),
+                            ('gave_up', 'Not restarted, crash loop'),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                (
+                    'node',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='incidents',
+                        to='demoservice.Node',
+                    ),
+                ),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='demoincident',
+            index=models.Index(
+                fields=['demo_url', 'created_at'],
+                name='incident_demo_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('demoservice', '0012_demoincident'),
+    ]
+    operations = [
+        migrations.AddField(
+            model_name='demo',
+            name='disk_usage',
+            field=models.BigIntegerField(
+                default=0,
+                help_text=(
+                    'Bytes used by the checkout, measured after build steps'
+                ),
+            ),
+        ),
+        migrations.AddField(
+            model_name='demo',
+            name='disk_usage_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,278 @@
+from django.db import models
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by every worker talking to the same API"""
+
+    name = models.CharField(max_length=64, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+    blocked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Node(models.Model):
+    """A Docker engine that demos can be scheduled on"""
+
+    name = models.CharField(max_length=100, unique=True)
+    docker_url = models.CharField(
+        max_length=255,
+        help_text='Docker API URL, ex: tcp://demos-2.internal:2375',
+    )
+    address = models.CharField(
+        max_length=255,
+        help_text='Host name or IP the demo ports are reachable on',
+    )
+    capacity = models.PositiveIntegerField(default=20)
+    enabled = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class Demo(models.Model):
+    """A demo and its last known state.
+
+    Docker labels remain the source of truth for routing; this registry
+    keeps the history and makes dashboard queries cheap.
+    """
+
+    IDLE = 'idle'
+    QUEUED = 'queued'
+    BUILDING = 'building'
+    RUNNING = 'running'
+    READY = 'ready'
+    FAILED = 'failed'
+    STOPPING = 'stopping'
+    STOPPED = 'stopped'
+    STATUS_CHOICES = [
+        (IDLE, 'Waiting for a visit'),
+        (QUEUED, 'Queued'),
+        (BUILDING, 'Building'),
+        (RUNNING, 'Starting up'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+        (STOPPING, 'Stopping'),
+        (STOPPED, 'Stopped'),
+    ]
+
+    GITHUB = 'github'
+    LAUNCHPAD = 'launchpad'
+    PROVIDER_CHOICES = [
+        (GITHUB, 'GitHub'),
+        (LAUNCHPAD, 'Launchpad'),
+    ]
+
+    url = models.CharField(max_length=255, unique=True)
+    url_full = models.CharField(max_length=255, blank=True)
+    vcs_provider = models.CharField(max_length=16, choices=PROVIDER_CHOICES)
+    user = models.CharField(max_length=100)
+    repo = models.CharField(max_length=100)
+    pr = models.CharField(max_length=32, blank=True)
+    branch = models.CharField(max_length=255, blank=True)
+    head_sha = models.CharField(max_length=40, blank=True)
+    port = models.PositiveIntegerField(null=True, blank=True)
+    node = models.ForeignKey(
+        Node,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='demos',
+    )
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED
+    )
+    last_error = models.TextField(blank=True)
+    start_task_id = models.CharField(max_length=255, blank=True)
+    snapshot = models.TextField(
+        blank=True,
+        help_text='JSON description of the containers, to resume the demo',
+    )
+    disk_usage = models.BigIntegerField(
+        default=0,
+        help_text='Bytes used by the checkout, measured after build steps',
+    )
+    disk_usage_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    running_at = models.DateTimeField(null=True, blank=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    stopped_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['url']
+        indexes = [
+            models.Index(
+                fields=['status', 'url'], name='demo_status_url_idx'
+            ),
+            models.Index(
+                fields=['vcs_provider', 'user', 'repo', 'pr'],
+                name='demo_vcs_lookup_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.url
+
+    @property
+    def vcs_url(self):
+        if self.vcs_provider == self.LAUNCHPAD:
+            return (
+                'https://code.launchpad.net/'
+                '{user}/{repo}/+git/{repo}/+merge/{id}'
+            ).format(user=self.user, repo=self.repo, id=self.pr)
+
+        url = ''
+        if self.branch:
+            url = 'https://github.com/{user}/{repo}/tree/{branch}'.format(
+                user=self.user,
+                repo=self.repo,
+                branch=self.branch,
+            )
+        if self.pr:
+            url = 'https://github.com/{user}/{repo}/pull/{id}'.format(
+                user=self.user,
+                repo=self.repo,
+                id=self.pr,
+            )
+        return url
+
+
+class StartTiming(models.Model):
+    """How long a demo start took, kept per start for latency reporting"""
+
+    demo_url = models.CharField(max_length=255)
+    vcs_provider = models.CharField(
+        max_length=16, choices=Demo.PROVIDER_CHOICES
+    )
+    user = models.CharField(max_length=100)
+    repo = models.CharField(max_length=100)
+    build_seconds = models.FloatField(null=True)
+    ready_seconds = models.FloatField(null=True)
+    total_seconds = models.FloatField(null=True)
+    is_ready = models.BooleanField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'repo', 'created_at'],
+                name='timing_repo_idx',
+            ),
+        ]
+
+
+class BlobFact(models.Model):
+    """Something derived from a file in a repository, cached by blob SHA.
+
+    The same blob always gives the same result, so repeat starts of a
+    commit don't have to work it out again.
+    """
+
+    repo = models.CharField(max_length=255)
+    blob_sha = models.CharField(max_length=40)
+    name = models.CharField(max_length=64)
+    value = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('repo', 'blob_sha', 'name')]
+
+
+class CachedImage(models.Model):
+    """A built demo image kept for later starts of the same source"""
+
+    node = models.ForeignKey(
+        Node,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='cached_images',
+    )
+    repo = models.CharField(max_length=255)
+    source_hash = models.CharField(max_length=40)
+    tag = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    last_used_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('node', 'repo', 'source_hash')]
+
+    def __str__(self):
+        return self.tag
+
+
+class DemoIncident(models.Model):
+    """A demo container that stopped on its own, and what was done about it"""
+
+    SCHEDULED = 'scheduled'
+    RESTARTED = 'restarted'
+    RESTART_FAILED = 'restart_failed'
+    SKIPPED = 'skipped'
+    GAVE_UP = 'gave_up'
+    ACTION_CHOICES = [
+        (SCHEDULED, 'Restart scheduled'),
+        (RESTARTED, 'Restarted'),
+        (RESTART_FAILED, 'Restart failed'),
+        (SKIPPED, 'Not restarted, the demo changed in the meantime'),
+        (GAVE_UP, 'Not restarted, crash loop'),
+    ]
+
+    demo_url = models.CharField(max_length=255)
+    node = models.ForeignKey(
+        Node,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='incidents',
+    )
+    container_name = models.CharField(max_length=255)
+    event = models.CharField(max_length=16, help_text='die or oom')
+    exit_code = models.IntegerField(null=True, blank=True)
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['demo_url', 'created_at'],
+                name='incident_demo_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.container_name, self.event)
+
+
+class PendingStart(models.Model):
+    """A demo start waiting for its turn in the fair-share scheduler"""
+
+    demo_url = models.CharField(max_length=255, unique=True)
+    vcs_provider = models.CharField(
+        max_length=16, choices=Demo.PROVIDER_CHOICES
+    )
+    user = models.CharField(max_length=100)
+    repo = models.CharField(max_length=100)
+    options = models.TextField(help_text='JSON arguments of the start')
+    not_before = models.DateTimeField(null=True, blank=True)
+    held = models.BooleanField(
+        default=False,
+        help_text='Start of a lazy demo, waiting for its first visit',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return self.demo_url
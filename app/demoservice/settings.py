@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'demoservice.middleware.LazyDemoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -161,14 +162,218 @@ CELERY_BROKER_URL = 'amqp://guest:guest@{host}:{port}//'.format(
 
 CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", False)
 
+CELERY_IMPORTS = [
+    'demoservice.tasks.backfill',
+    'demoservice.tasks.github',
+    'demoservice.tasks.launchpad',
+    'demoservice.tasks.maintenance',
+    'demoservice.tasks.readiness',
+    'demoservice.tasks.routing',
+    'demoservice.tasks.scheduler',
+    'demoservice.tasks.watchdog',
+]
+
+CELERY_BEAT_SCHEDULE = {
+    'collect-garbage': {
+        'task': 'demoservice.tasks.maintenance.collect_garbage_task',
+        'schedule': int(os.environ.get('DEMO_GC_INTERVAL', 60 * 60)),
+    },
+    'sync-registry': {
+        'task': 'demoservice.tasks.maintenance.sync_registry_task',
+        'schedule': 60,
+    },
+    'update-disk-usage': {
+        'task': 'demoservice.tasks.maintenance.update_disk_usage_task',
+        'schedule': 5 * 60,
+    },
+    # Starts are dispatched as they are queued, this fills freed up slots
+    'dispatch-starts': {
+        'task': 'demoservice.tasks.scheduler.dispatch_starts_task',
+        'schedule': 10,
+    },
+}
+
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
+GITHUB_API_TIMEOUT = int(os.environ.get('GITHUB_API_TIMEOUT', 10))
+
+# Token bucket shared by all workers for GitHub API calls. GitHub allows
+# 5000 requests an hour, but content creation has stricter secondary limits.
+GITHUB_RATE_LIMIT_PER_SECOND = float(
+    os.environ.get('GITHUB_RATE_LIMIT_PER_SECOND', 0.5)
+)
+GITHUB_RATE_LIMIT_BURST = int(os.environ.get('GITHUB_RATE_LIMIT_BURST', 10))
+GITHUB_SECONDARY_RATE_LIMIT_WAIT = 60
+GITHUB_NOTIFY_RATE_LIMIT_RETRIES = 20
 
 DEMO_DIR = '/srv/run.demo.haus-demos/'
 if DEBUG:
     DEMO_DIR = os.path.join(BASE_DIR, 'demos')
 
+# Stopped demos are moved here and deleted in throttled batches
+DEMO_TRASH_DIR = os.path.join(DEMO_DIR, '.trash')
+DEMO_RECLAIM_BATCH_SIZE = int(os.environ.get('DEMO_RECLAIM_BATCH_SIZE', 500))
+DEMO_RECLAIM_BATCH_PAUSE = float(
+    os.environ.get('DEMO_RECLAIM_BATCH_PAUSE', 0.05)
+)
+DEMO_STOP_TIMEOUT = int(os.environ.get('DEMO_STOP_TIMEOUT', 10))
+# Docker API calls give up after DEMO_DOCKER_TIMEOUT seconds. Clients are
+# kept per process and ping their engine when unused for a while.
+DEMO_DOCKER_TIMEOUT = int(os.environ.get('DEMO_DOCKER_TIMEOUT', 60))
+DEMO_DOCKER_PING_INTERVAL = 30
+
+# Restarts of crashed demo containers by the watch_demos command. The delay
+# doubles with every restart in DEMO_WATCHDOG_CRASH_WINDOW seconds, after
+# DEMO_WATCHDOG_MAX_RESTARTS of them the demo is left failed.
+DEMO_WATCHDOG_BACKOFF = 10
+DEMO_WATCHDOG_MAX_BACKOFF = 5 * 60
+DEMO_WATCHDOG_MAX_RESTARTS = int(
+    os.environ.get('DEMO_WATCHDOG_MAX_RESTARTS', 5)
+)
+DEMO_WATCHDOG_CRASH_WINDOW = 60 * 60
+# Shorter than DEMO_DOCKER_TIMEOUT, so reading events never times out
+DEMO_WATCHDOG_POLL_INTERVAL = 30
+# How often the watchdog looks for registered or removed nodes
+DEMO_WATCHDOG_NODES_INTERVAL = 60
+# How often a building demo checks whether it was stopped in the meantime
+DEMO_CANCEL_POLL_INTERVAL = 2
+
+# How demo working trees are created: "clone" gives every demo a full
+# clone, "reflink" makes a copy-on-write copy of a per-repository base tree
+# (needs a filesystem with reflink support, such as btrfs or XFS).
+DEMO_STORAGE_MODE = os.environ.get('DEMO_STORAGE_MODE', 'clone')
+DEMO_BASE_DIR = os.path.join(DEMO_DIR, '.base')
+
+# New demos are fetched into a staging directory while the start is being
+# authorized, and only moved into place once it is allowed
+DEMO_SPECULATIVE_START = (
+    os.environ.get('DEMO_SPECULATIVE_START', 'true').lower() == 'true'
+)
+DEMO_STAGING_DIR = os.path.join(DEMO_DIR, '.staging')
+
+# Package manager caches shared by demos, keyed by lockfile hash
+DEMO_CACHE_DIR = os.path.join(DEMO_DIR, '.cache')
+DEMO_CACHE_MAX_BYTES = int(
+    os.environ.get('DEMO_CACHE_MAX_BYTES', 20 * 1024 ** 3)
+)
+
+# Built Launchpad demo images kept per source tree, evicted LRU per node
+DEMO_IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get('DEMO_IMAGE_CACHE_MAX_BYTES', 20 * 1024 ** 3)
+)
+
+# Disk used by the demo checkouts, measured after every build step with
+# a per-directory cache in DEMO_USAGE_DIR. Over the high-water mark the
+# oldest demos are stopped before any new start is dispatched, until the
+# checkouts are back under the low-water mark. 0 disables eviction.
+DEMO_USAGE_DIR = os.path.join(DEMO_DIR, '.usage')
+DEMO_DISK_HIGH_WATER_BYTES = int(
+    os.environ.get('DEMO_DISK_HIGH_WATER_BYTES', 200 * 1024 ** 3)
+)
+DEMO_DISK_LOW_WATER_BYTES = int(
+    os.environ.get('DEMO_DISK_LOW_WATER_BYTES', 160 * 1024 ** 3)
+)
+# Files that grow in place don't change their directory, so every
+# checkout is walked in full now and then
+DEMO_DISK_RESCAN_INTERVAL = 6 * 60 * 60
+
+# Host ports ./run demos are published on, checked against the containers
+# of the node they run on. Docker assigns ports from 32768 up itself.
+DEMO_PORT_RANGE = (
+    int(os.environ.get('DEMO_PORT_MIN', 20000)),
+    int(os.environ.get('DEMO_PORT_MAX', 32768)),
+)
+
+# Per-demo build logs, each capped at DEMO_BUILD_LOG_MAX_BYTES
+DEMO_LOG_DIR = os.path.join(DEMO_DIR, '.logs')
+DEMO_BUILD_LOG_MAX_BYTES = int(
+    os.environ.get('DEMO_BUILD_LOG_MAX_BYTES', 2 * 1024 ** 2)
+)
+DEMO_BUILD_LOG_TAIL = 64 * 1024
+
+# Live dashboard updates
+DEMO_EVENTS_BUFFER = 100
+DEMO_EVENTS_MAX_AGE = 10 * 60
+DEMO_EVENTS_PUBLISH_TIMEOUT = 1
+
+# Readiness probing of started demos. Ports are probed on the node address,
+# or DEMO_PROBE_HOST for demos running next to the worker. Empty means the
+# Docker host, as localhost is the worker's own container.
+DEMO_PROBE_HOST = os.environ.get('DEMO_PROBE_HOST', '')
+DEMO_PROBE_PUBLIC_URL = (
+    os.environ.get('DEMO_PROBE_PUBLIC_URL', 'true').lower() == 'true'
+)
+DEMO_PROBE_TIMEOUT = 5
+DEMO_PROBE_INTERVAL = int(os.environ.get('DEMO_PROBE_INTERVAL', 30))
+DEMO_READY_TIMEOUT = int(os.environ.get('DEMO_READY_TIMEOUT', 30 * 60))
+
+# How Traefik learns the demo routes: "docker" has it poll the container
+# labels, "file" writes them to DEMO_ROUTING_FILE for its file provider
+# whenever a demo changes status. Demos running next to the worker are
+# reached on DEMO_ROUTING_HOST. Empty means the Docker host, as localhost
+# would be Traefik's own container.
+DEMO_ROUTING_PROVIDER = os.environ.get('DEMO_ROUTING_PROVIDER', 'docker')
+DEMO_ROUTING_FILE = os.environ.get(
+    'DEMO_ROUTING_FILE', os.path.join(DEMO_DIR, '.routing', 'demos.toml')
+)
+DEMO_ROUTING_HOST = os.environ.get('DEMO_ROUTING_HOST', '')
+# Only the workers write the file, this long after a status change
+DEMO_ROUTING_DELAY = 1
+# Where the file routes hosts without a demo, the lazy demo placeholder
+DEMO_ROUTING_PLACEHOLDER_URL = os.environ.get(
+    'DEMO_ROUTING_PLACEHOLDER_URL', ''
+)
+
+# Fair-share scheduling of demo starts. Weights and concurrency caps are
+# given per repository (user/repo=N) or organisation (user=N), separated by
+# spaces, ex: DEMO_SCHEDULER_CONCURRENCY="renovate-bot=1 canonical/docs=4"
+DEMO_SCHEDULER_MAX_IN_FLIGHT = int(
+    os.environ.get('DEMO_SCHEDULER_MAX_IN_FLIGHT', 8)
+)
+DEMO_SCHEDULER_DEFAULT_CONCURRENCY = int(
+    os.environ.get('DEMO_SCHEDULER_DEFAULT_CONCURRENCY', 2)
+)
+DEMO_SCHEDULER_WEIGHTS = os.environ.get('DEMO_SCHEDULER_WEIGHTS', '').split()
+DEMO_SCHEDULER_CONCURRENCY = os.environ.get(
+    'DEMO_SCHEDULER_CONCURRENCY', ''
+).split()
+DEMO_SCHEDULER_STALE_AFTER = 60 * 60
+
+# Repositories (user/repo) or organisations (user) whose demos are only
+# built once somebody visits them, separated by spaces
+DEMO_LAZY_REPOS = os.environ.get('DEMO_LAZY_REPOS', '').split()
+
+# How many demos resume_demos brings back at the same time
+DEMO_RESUME_WORKERS = int(os.environ.get('DEMO_RESUME_WORKERS', 8))
+
+# Repositories whose open PRs backfill_demos starts, separated by spaces.
+# GitHub ones as user/repo, Launchpad ones as lp:<repository path>.
+DEMO_BACKFILL_REPOS = os.environ.get('DEMO_BACKFILL_REPOS', '').split()
+DEMO_BACKFILL_BATCH_SIZE = int(os.environ.get('DEMO_BACKFILL_BATCH_SIZE', 5))
+DEMO_BACKFILL_BATCH_INTERVAL = int(
+    os.environ.get('DEMO_BACKFILL_BATCH_INTERVAL', 120)
+)
+
+# Garbage collection of closed demos and leftovers of failed starts
+DEMO_GC_GRACE_PERIOD = int(os.environ.get('DEMO_GC_GRACE_PERIOD', 60 * 60))
+DEMO_GC_MAX_REMOVALS = int(os.environ.get('DEMO_GC_MAX_REMOVALS', 10))
+DEMO_GC_REMOVAL_PAUSE = float(os.environ.get('DEMO_GC_REMOVAL_PAUSE', 5))
+
 GITHUB_WEBHOOK_SECRET = os.environ.get('GITHUB_WEBHOOK_SECRET')
 
+# Webhooks are written to a SQLite spool local to the web container and
+# handed to the broker by manage.py forward_webhooks, so a slow or
+# unreachable broker never holds up a delivery. Empty to handle them in the
+# request instead.
+DEMO_WEBHOOK_SPOOL = os.environ.get(
+    'DEMO_WEBHOOK_SPOOL', os.path.join(BASE_DIR, 'spool', 'webhooks.sqlite3')
+)
+DEMO_WEBHOOK_SPOOL_BATCH_SIZE = 50
+DEMO_WEBHOOK_SPOOL_POLL_INTERVAL = 1
+DEMO_WEBHOOK_SPOOL_MAX_ATTEMPTS = int(
+    os.environ.get('DEMO_WEBHOOK_SPOOL_MAX_ATTEMPTS', 20)
+)
+DEMO_WEBHOOK_SPOOL_MAX_BACKOFF = 5 * 60
+
 LAUNCHPAD_ALLOWED_TEAMS = ["canonical-webmonkeys"]
 LAUNCHPAD_WEBHOOK_SECRET = os.environ.get('LAUNCHPAD_WEBHOOK_SECRET')
 
@@ -204,7 +409,9 @@ LOGGING = {
 if os.environ.get('LOGSTASH_HOST'):
     LOGGING['handlers']['logstash'] = {
         'level': log_level,
-        'class': 'logstash.LogstashHandler',
+        # Sends from a background thread so logging never waits on Logstash
+        'class': 'demoservice.logging.QueueShippingHandler',
+        'target_class': 'logstash.LogstashHandler',
         'host': os.environ.get('LOGSTASH_HOST'),
         'port': int(os.environ.get('LOGSTASH_PORT', 5959)),
         'version': 1,
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown
 
 
 # set the default Django settings module for the 'celery' program.
@@ -15,3 +16,11 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+
+@worker_process_shutdown.connect
+def flush_logs(**kwargs):
+    # Pool processes exit without running atexit handlers
+    from demoservice.logging import flush_log_handlers
+
+    flush_log_handlers()
@@ -0,0 +1,14 @@
+import logging
+from demoservice.libs.backfill import backfill_demos
+from demoservice.tasks import app
+
+
+@app.task(bind=True, ignore_result=True)
+def backfill_demos_task(self, repos=None):
+    logger = logging.getLogger(__name__)
+    logger.info("Starting backfill_demos_task task")
+
+    try:
+        backfill_demos(repos=repos, progress=logger.info)
+    except Exception as e:
+        logger.error(e)
@@ -1,13 +1,32 @@
+import random
 from celery import chain
+from celery.utils import uuid
+from django.conf import settings
+from demoservice.libs.buildlogs import BuildLog
 from demoservice.libs.demos import (
     get_demo_context,
     get_demo_url_pr,
     notify_github_pr,
+    reclaim_demo,
     start_demo,
     stop_demo,
 )
+from demoservice.libs.github_api import GitHubRateLimited
+from demoservice.libs.lazy import should_hold_start
+from demoservice.libs.nodes import place_demo
+from demoservice.libs.registry import (
+    DemoCancelled,
+    cancel_demo_start,
+    is_demo_cancelled,
+    register_demo,
+    set_demo_status,
+)
+from demoservice.libs.scheduler import enqueue_start
 from demoservice.logging import get_demo_logger
+from demoservice.models import Demo
 from demoservice.tasks import app
+from demoservice.tasks.readiness import wait_for_demo_task
+from demoservice.tasks.scheduler import dispatch_starts_task
 
 
 @app.task(bind=True, max_retries=2)
@@ -20,28 +39,63 @@ def start_demo_task(
     context,
     github_sender=None,
     github_verify_sender=True,
+    github_verified_sha=None,
     **kwargs
 ):
     logger = get_demo_logger(__name__, **context)
     logger.debug('Starting start_demo_task task for %s', demo_url)
+    if is_demo_cancelled(demo_url):
+        logger.info('Start of %s was cancelled', demo_url)
+        return None
+
+    node = place_demo(demo_url)
+    if node:
+        logger.info('Scheduling %s on node %s', demo_url, node.name)
+    set_demo_status(
+        demo_url,
+        Demo.BUILDING,
+        from_status=[Demo.QUEUED, Demo.FAILED],
+        snapshot='',
+    )
 
     try:
-        return start_demo(
+        message = start_demo(
             demo_url=demo_url,
             github_user=github_user,
             github_repo=github_repo,
             github_pr=github_pr,
             github_sender=github_sender,
             github_verify_sender=github_verify_sender,
+            github_verified_sha=github_verified_sha,
             context=context,
         )
+    except DemoCancelled as e:
+        logger.info(e)
+        BuildLog(demo_url).write('Cancelled\n')
+        return None
     except Exception as e:
         logger.error(e)
+        BuildLog(demo_url).write('Error: {}\n'.format(e))
+        set_demo_status(
+            demo_url,
+            Demo.FAILED,
+            from_status=Demo.BUILDING,
+            last_error=str(e),
+        )
         # Retry on failure with a growing cooldown
         retry_count = self.request.retries
         seconds_to_wait = 2 * retry_count
         raise self.retry(exc=e, countdown=seconds_to_wait)
 
+    # start_demo only marks the demo as running once ./run has started it
+    set_demo_status(
+        demo_url,
+        Demo.FAILED,
+        from_status=Demo.BUILDING,
+        last_error=message or 'Demo could not be started',
+    )
+    return message
+
 
 @app.task(bind=True, max_retries=2)
 def stop_demo_task(
@@ -63,6 +117,31 @@ def stop_demo_task(
         raise self.retry(exc=e, countdown=seconds_to_wait)
 
 
+@app.task(bind=True, max_retries=2)
+def reclaim_demo_task(
+    self,
+    trash_path,
+    demo_url,
+    context,
+    **kwargs
+):
+    logger = get_demo_logger(__name__, **context)
+    logger.debug('Running the reclaim_demo task for %s', demo_url)
+
+    try:
+        return reclaim_demo(
+            trash_path=trash_path,
+            demo_url=demo_url,
+            context=context,
+        )
+    except Exception as e:
+        logger.error(e)
+        # Retry on failure with a growing cooldown
+        retry_count = self.request.retries
+        seconds_to_wait = 2 * retry_count
+        raise self.retry(exc=e, countdown=seconds_to_wait)
+
+
 @app.task(bind=True, max_retries=3)
 def notify_github_task(
     self,
@@ -89,11 +168,21 @@ def notify_github_task(
             github_pr=github_pr,
             context=context,
         )
+    except GitHubRateLimited as e:
+        logger.warning(e)
+        # Wait for as long as GitHub asked us to. Being rate limited is
+        # expected during busy periods so it has its own retry budget.
+        seconds_to_wait = e.retry_after + random.uniform(0, 10)
+        raise self.retry(
+            exc=e,
+            countdown=seconds_to_wait,
+            max_retries=settings.GITHUB_NOTIFY_RATE_LIMIT_RETRIES,
+        )
     except Exception as e:
         logger.error(e)
-        # If the notification fails, retry with a growing cooldown
+        # If the notification fails, retry with an exponential cooldown
         retry_count = self.request.retries
-        seconds_to_wait = 3 * retry_count + 1
+        seconds_to_wait = 2 ** (retry_count + 1) + random.uniform(0, 1)
         raise self.retry(exc=e, countdown=seconds_to_wait)
 
 
@@ -103,7 +192,9 @@ def queue_start_demo(
     github_pr,
     github_sender=None,
     github_verify_sender=True,
+    github_verified_sha=None,
     send_github_notification=False,
+    countdown=None,
 ):
     demo_url = get_demo_url_pr(github_user, github_repo, github_pr)
     context = get_demo_context(
@@ -121,13 +212,73 @@ def queue_start_demo(
         demo_url,
     )
 
+    held = should_hold_start(demo_url, github_user, github_repo)
+    register_demo(
+        demo_url=demo_url,
+        vcs_provider=Demo.GITHUB,
+        user=github_user,
+        repo=github_repo,
+        pr=github_pr,
+        status=Demo.IDLE if held else Demo.QUEUED,
+    )
+    enqueue_start(
+        demo_url=demo_url,
+        vcs_provider=Demo.GITHUB,
+        user=github_user,
+        repo=github_repo,
+        options={
+            'github_user': github_user,
+            'github_repo': github_repo,
+            'github_pr': github_pr,
+            'github_sender': github_sender,
+            'github_verify_sender': github_verify_sender,
+            'github_verified_sha': github_verified_sha,
+            'send_github_notification': send_github_notification,
+        },
+        countdown=countdown,
+        held=held,
+    )
+    if not held:
+        dispatch_starts_task.delay()
+    elif send_github_notification:
+        # The link is what gets the demo built, so it can't wait for it
+        message = 'Demo at: https://{url}/ (built on the first visit)'.format(
+            url=demo_url,
+        )
+        notify_github_task.delay(message=message, context=context, **context)
+
+
+def apply_start_demo(
+    github_user,
+    github_repo,
+    github_pr,
+    github_sender=None,
+    github_verify_sender=True,
+    github_verified_sha=None,
+    send_github_notification=False,
+):
+    """Send a start picked by the scheduler to the workers"""
+    demo_url = get_demo_url_pr(github_user, github_repo, github_pr)
+    context = get_demo_context(
+        demo_url=demo_url,
+        github_user=github_user,
+        github_repo=github_repo,
+        github_pr=github_pr,
+    )
+
+    # The task id is kept so a close of the PR can revoke the start
+    start_task_id = uuid()
+    Demo.objects.filter(url=demo_url).update(start_task_id=start_task_id)
+
     tasks = [
         start_demo_task.s(
             context=context,
             github_sender=github_sender,
             github_verify_sender=github_verify_sender,
+            github_verified_sha=github_verified_sha,
             **context,
-        )
+        ).set(task_id=start_task_id),
+        wait_for_demo_task.s(context=context, **context),
     ]
     if send_github_notification:
         tasks.append(notify_github_task.s(context=context, **context))
@@ -155,4 +306,9 @@ def queue_stop_demo(
         demo_url,
     )
 
-    stop_demo_task.delay(context=context, **context)
+    set_demo_status(demo_url, Demo.STOPPING)
+    cancel_demo_start(demo_url)
+    chain(
+        stop_demo_task.s(context=context, **context),
+        reclaim_demo_task.s(context=context, **context),
+    ).apply_async()
@@ -1,9 +1,25 @@
 import logging
+from celery import chain
+from celery.utils import uuid
+from demoservice.libs.buildlogs import BuildLog
 from demoservice.libs.demos import (
+    reclaim_launchpad_demo,
     start_launchpad_demo,
     stop_launchpad_demo
 )
+from demoservice.libs.nodes import place_demo
+from demoservice.libs.registry import (
+    DemoCancelled,
+    cancel_demo_start,
+    is_demo_cancelled,
+    register_demo,
+    set_demo_status,
+)
+from demoservice.libs.scheduler import enqueue_start
+from demoservice.models import Demo
 from demoservice.tasks import app
+from demoservice.tasks.readiness import wait_for_demo_task
+from demoservice.tasks.scheduler import dispatch_starts_task
 
 
 @app.task(bind=True, max_retries=2)
@@ -19,8 +35,21 @@ def start_launchpad_demo_task(
 ):
     logger = logging.getLogger(__name__)
     logger.info("Starting start_launchpad_demo_task task for %s", demo_url)
+    if is_demo_cancelled(demo_url):
+        logger.info("Start of %s was cancelled", demo_url)
+        return None
+
+    node = place_demo(demo_url)
+    if node:
+        logger.info("Scheduling %s on node %s", demo_url, node.name)
+    set_demo_status(
+        demo_url,
+        Demo.BUILDING,
+        from_status=[Demo.QUEUED, Demo.FAILED],
+        snapshot='',
+    )
     try:
-        return start_launchpad_demo(
+        message = start_launchpad_demo(
             demo_url=demo_url,
             user=user,
             repo=repo,
@@ -28,13 +57,32 @@ def start_launchpad_demo_task(
             pr=pr,
             context=context
         )
+    except DemoCancelled as e:
+        logger.info(e)
+        BuildLog(demo_url).write("Cancelled\n")
+        return None
     except Exception as e:
         logger.error(e)
+        BuildLog(demo_url).write("Error: {}\n".format(e))
+        set_demo_status(
+            demo_url,
+            Demo.FAILED,
+            from_status=Demo.BUILDING,
+            last_error=str(e),
+        )
         # Retry on failure with a growing cooldown
         retry_count = self.request.retries
         seconds_to_wait = 2 * retry_count
         raise self.retry(exc=e, countdown=seconds_to_wait)
 
+    set_demo_status(
+        demo_url,
+        Demo.FAILED,
+        from_status=Demo.BUILDING,
+        last_error="Demo could not be started",
+    )
+    return message
+
 
 @app.task(bind=True, max_retries=2)
 def stop_launchpad_demo_task(
@@ -59,13 +107,39 @@ def stop_launchpad_demo_task(
         raise self.retry(exc=e, countdown=seconds_to_wait)
 
 
+@app.task(bind=True, max_retries=2)
+def reclaim_launchpad_demo_task(
+    self,
+    trash_path,
+    demo_url,
+    context,
+    **kwargs
+):
+    logger = logging.getLogger(__name__)
+    logger.info("Starting reclaim_launchpad_demo_task task for %s", demo_url)
+
+    try:
+        return reclaim_launchpad_demo(
+            trash_path=trash_path,
+            demo_url=demo_url,
+            context=context
+        )
+    except Exception as e:
+        logger.error(e)
+        # Retry on failure with a growing cooldown
+        retry_count = self.request.retries
+        seconds_to_wait = 2 * retry_count
+        raise self.retry(exc=e, countdown=seconds_to_wait)
+
+
 def queue_start_launchpad_demo(
     demo_url,
     user,
     repo,
     branch,
     pr,
-    context
+    context,
+    countdown=None
 ):
     logger = logging.getLogger(__name__)
     logger.info(
@@ -76,10 +150,38 @@ def queue_start_launchpad_demo(
         demo_url,
     )
 
-    start_launchpad_demo_task.delay(
-        context=context,
-        **context
+    register_demo(
+        demo_url=demo_url,
+        vcs_provider=Demo.LAUNCHPAD,
+        user=user,
+        repo=repo,
+        pr=pr,
+        branch=branch,
+    )
+    enqueue_start(
+        demo_url=demo_url,
+        vcs_provider=Demo.LAUNCHPAD,
+        user=user,
+        repo=repo,
+        options={"context": context},
+        countdown=countdown,
     )
+    dispatch_starts_task.delay()
+
+
+def apply_start_launchpad_demo(context):
+    """Send a start picked by the scheduler to the workers"""
+    demo_url = context["demo_url"]
+
+    # The task id is kept so a close of the merge proposal can revoke it
+    start_task_id = uuid()
+    Demo.objects.filter(url=demo_url).update(start_task_id=start_task_id)
+    chain(
+        start_launchpad_demo_task.s(context=context, **context).set(
+            task_id=start_task_id
+        ),
+        wait_for_demo_task.s(context=context, **context),
+    ).apply_async()
 
 
 def queue_stop_launchpad_demo(
@@ -99,7 +201,9 @@ def queue_stop_launchpad_demo(
         demo_url,
     )
 
-    stop_launchpad_demo_task.delay(
-        context=context,
-        **context
-    )
+    set_demo_status(demo_url, Demo.STOPPING)
+    cancel_demo_start(demo_url)
+    chain(
+        stop_launchpad_demo_task.s(context=context, **context),
+        reclaim_launchpad_demo_task.s(context=context, **context),
+    ).apply_async()
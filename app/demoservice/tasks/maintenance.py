@@ -0,0 +1,63 @@
+import logging
+from demoservice.libs.diskusage import measure_demos
+from demoservice.libs.reconcile import (
+    collect_garbage,
+    remove_garbage,
+    sync_registry,
+)
+from demoservice.tasks import app
+
+
+@app.task(bind=True, ignore_result=True)
+def collect_garbage_task(self):
+    logger = logging.getLogger(__name__)
+    logger.info("Starting collect_garbage_task task")
+
+    # Runs periodically, so a failure simply waits for the next run
+    try:
+        queued = collect_garbage()
+    except Exception as e:
+        logger.error(e)
+        return None
+
+    logger.info("Garbage collection queued %s removals", queued)
+    return queued
+
+
+@app.task(bind=True, ignore_result=True)
+def remove_garbage_task(self, kind, target, labels=None, node_id=None):
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting remove_garbage_task task for %s", target)
+
+    # Whatever is left is found again by the next garbage collection
+    try:
+        remove_garbage(kind, target, labels=labels, node_id=node_id)
+    except Exception as e:
+        logger.error("Could not remove %s %s: %s", kind, target, e)
+
+
+@app.task(bind=True, ignore_result=True)
+def sync_registry_task(self):
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting sync_registry_task task")
+
+    try:
+        sync_registry()
+    except Exception as e:
+        logger.error(e)
+
+
+@app.task(bind=True, ignore_result=True)
+def update_disk_usage_task(self):
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting update_disk_usage_task task")
+
+    # Catches what running demos write to their checkouts after the build
+    try:
+        total = measure_demos()
+    except Exception as e:
+        logger.error(e)
+        return None
+
+    logger.debug("Demo checkouts use %s bytes", total)
+    return total
@@ -0,0 +1,64 @@
+import logging
+from django.conf import settings
+from django.utils import timezone
+from demoservice.libs.readiness import (
+    get_probe_delay,
+    get_ready_deadline,
+    is_demo_ready,
+    record_start_timing,
+)
+from demoservice.libs.registry import set_demo_status
+from demoservice.models import Demo
+from demoservice.tasks import app
+
+
+@app.task(bind=True, max_retries=None)
+def wait_for_demo_task(
+    self,
+    message,
+    demo_url,
+    context,
+    record_timing=True,
+    **kwargs
+):
+    """Hold the chain until the demo answers requests.
+
+    Polls with a growing interval until DEMO_READY_TIMEOUT has passed,
+    then passes the start message on to the next task in the chain.
+    Resumed demos don't record a start timing, as they were not built.
+    """
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting wait_for_demo_task task for %s", demo_url)
+
+    demo = Demo.objects.filter(url=demo_url).select_related("node").first()
+    if not demo or demo.status != Demo.RUNNING:
+        # The demo didn't start, there is nothing to wait for
+        return message
+
+    if settings.DEBUG:
+        set_demo_status(demo_url, Demo.READY, from_status=Demo.RUNNING)
+        return message
+
+    if is_demo_ready(demo):
+        logger.info("Demo %s is ready", demo_url)
+        set_demo_status(demo_url, Demo.READY, from_status=Demo.RUNNING)
+        if record_timing:
+            record_start_timing(demo, is_ready=True)
+        return message
+
+    if timezone.now() < get_ready_deadline(demo):
+        raise self.retry(countdown=get_probe_delay(self.request.retries))
+
+    logger.warning("Demo %s is not responding", demo_url)
+    Demo.objects.filter(url=demo_url).update(
+        last_error="Demo did not respond within {} seconds".format(
+            settings.DEMO_READY_TIMEOUT
+        ),
+    )
+    if record_timing:
+        record_start_timing(demo, is_ready=False)
+    if message:
+        message += (
+            "\n\nThe demo is not responding yet, it may still be starting."
+        )
+    return message
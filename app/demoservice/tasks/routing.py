@@ -0,0 +1,12 @@
+import logging
+from demoservice.libs.routing import update_routes
+from demoservice.tasks import app
+
+
+@app.task(bind=True, ignore_result=True)
+def update_routes_task(self, since=None):
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting update_routes_task task")
+
+    # update_routes logs its own errors, the registry sync tries again
+    update_routes(since=since)
@@ -0,0 +1,15 @@
+import logging
+from demoservice.libs.scheduler import dispatch_starts
+from demoservice.tasks import app
+
+
+@app.task(bind=True, ignore_result=True)
+def dispatch_starts_task(self):
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting dispatch_starts_task task")
+
+    # The next run picks up whatever this one couldn't dispatch
+    try:
+        dispatch_starts()
+    except Exception as e:
+        logger.error(e)
@@ -0,0 +1,16 @@
+import logging
+from demoservice.libs.watchdog import restart_container
+from demoservice.tasks import app
+
+
+@app.task(bind=True, ignore_result=True)
+def restart_container_task(self, incident_id):
+    logger = logging.getLogger(__name__)
+    logger.debug("Starting restart_container_task task for %s", incident_id)
+
+    # The incident records the failure, a new crash gets a new restart
+    try:
+        return restart_container(incident_id)
+    except Exception as e:
+        logger.error(e)
+        return None
@@ -23,6 +23,10 @@ from demoservice.views import (
     DemoIndexView,
     DemoStartView,
     DemoStopView,
+    backfill,
+    demo_events,
+    demo_log,
+    disk_usage,
     github_webhook,
     launchpad_webhook
 )
@@ -49,6 +53,26 @@ urlpatterns = [
         _login_required(DemoStopView.as_view()),
         name='demo_stop',
     ),
+    url(
+        r'^backfill$',
+        _login_required(backfill),
+        name='demo_backfill',
+    ),
+    url(
+        r'^disk-usage$',
+        _login_required(disk_usage),
+        name='demo_disk_usage',
+    ),
+    url(
+        r'^events$',
+        _login_required(demo_events),
+        name='demo_events',
+    ),
+    url(
+        r'^demos/(?P<demo_url>[\w.-]+)/log$',
+        _login_required(demo_log),
+        name='demo_log',
+    ),
     url(
         r'^$',
         _login_required(DemoIndexView.as_view()),
@@ -1,101 +1,144 @@
-import docker
 import hashlib
 import hmac
 import http
 import json
 import logging
-from operator import itemgetter
+import queue
+import sqlite3
+import time
 from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic.base import TemplateView
 from django.views.generic.edit import FormView
 from demoservice.forms import DemoStartForm, DemoStopForm
+from demoservice.libs.buildlogs import follow_build_log, tail_build_log
+from demoservice.libs.diskusage import get_disk_usage, get_total_disk_usage
+from demoservice.libs.events import broadcaster
 from demoservice.libs.github import handle_webhook
 from demoservice.libs.launchpad import (
     handle_webhook as handle_launchpad_webhook
 )
+from demoservice.libs.readiness import get_time_to_ready_by_repo
+from demoservice.libs.spool import GITHUB, LAUNCHPAD, spool_webhook
+from demoservice.models import Demo
+from demoservice.tasks.backfill import backfill_demos_task
 
 DEFAULT_VCS_USER = 'canonical-websites'
 logger = logging.getLogger(__name__)
 
 
-def _get_github_url(demo):
-    url = ''
-    if demo['github_branch']:
-        url = 'https://github.com/{user}/{repo}/tree/{branch}'.format(
-            user=demo['github_user'],
-            repo=demo['github_repo'],
-            branch=demo['github_branch'],
-        )
-    if demo['github_pr']:
-        url = 'https://github.com/{user}/{repo}/pull/{id}'.format(
-            user=demo['github_user'],
-            repo=demo['github_repo'],
-            id=demo['github_pr'],
-        )
-    return url
-
-
-def _get_launchpad_url(demo):
-    url = "https://code.launchpad.net/{user}/{repo}/+git/{repo}/+merge/{id}".format(
-        id=demo["github_pr"],
-        repo=demo["github_repo"],
-        user=demo["github_user"]
+class DemoIndexView(TemplateView):
+    template_name = 'demo_index.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['demos'] = Demo.objects.exclude(
+            status=Demo.STOPPED
+        ).select_related('node')
+        context['start_timings'] = get_time_to_ready_by_repo()
+        context['disk_usage'] = get_total_disk_usage()
+        context['disk_high_water'] = settings.DEMO_DISK_HIGH_WATER_BYTES
+        return context
+
+
+def _stream_demo_events():
+    subscriber = broadcaster.subscribe()
+    started = time.monotonic()
+    try:
+        yield 'retry: 5000\n\n'
+        # Close the stream now and then so gunicorn threads get recycled,
+        # the browser reconnects by itself.
+        while time.monotonic() - started < settings.DEMO_EVENTS_MAX_AGE:
+            try:
+                event = subscriber.get(timeout=15)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield 'event: demo\ndata: {}\n\n'.format(json.dumps(event))
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+def demo_events(request):
+    """Server-Sent Events stream of demo lifecycle changes"""
+    response = StreamingHttpResponse(
+        _stream_demo_events(),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _stream_build_log(demo_url, tail, follow):
+    data, offset = tail_build_log(demo_url, tail)
+    yield data
+    if not follow:
+        return
+
+    def is_building():
+        return Demo.objects.filter(
+            url=demo_url,
+            status__in=[Demo.QUEUED, Demo.BUILDING],
+        ).exists()
+
+    yield from follow_build_log(
+        demo_url,
+        offset,
+        is_building,
+        settings.DEMO_EVENTS_MAX_AGE,
     )
-    return url
 
 
-def _get_url(demo):
-    if demo["vcs_provider"] == "github":
-        return _get_github_url(demo)
-    elif demo["vcs_provider"] == "launchpad":
-        return _get_launchpad_url(demo)
-    else:
-        return ""
+def demo_log(request, demo_url):
+    """Build log of a demo, ?follow=1 streams it while the demo builds"""
+    if not Demo.objects.filter(url=demo_url).exists():
+        raise Http404('Demo not found')
 
+    try:
+        tail = int(request.GET.get('tail', settings.DEMO_BUILD_LOG_TAIL))
+    except ValueError:
+        tail = settings.DEMO_BUILD_LOG_TAIL
+    tail = min(max(tail, 0), settings.DEMO_BUILD_LOG_MAX_BYTES)
+    follow = request.GET.get('follow') == '1'
 
-class DemoIndexView(TemplateView):
-    template_name = 'demo_index.html'
+    response = StreamingHttpResponse(
+        _stream_build_log(demo_url, tail, follow),
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    def _get_running_demos(self,):
-        docker_client = docker.from_env()
-        demo_containers = docker_client.containers.list(
-            filters={
-                'status': 'running',
-                'label': 'run.demo',
-            }
-        )
-        demos = []
-        for container in demo_containers:
-            labels = container.labels
-            url = labels.get('run.demo.url', '')
-            url_full = labels.get('run.demo.url_full', url)
-            demo = {
-                'name': container.name,
-                'url': url,
-                'url_full': url_full,
-                'github_user': labels.get('run.demo.github_user', ''),
-                'github_repo': labels.get('run.demo.github_repo', ''),
-                'github_branch': labels.get('run.demo.github_branch', ''),
-                'github_pr': labels.get('run.demo.github_pr', ''),
-                'vcs_provider': labels.get('run.demo.vcs_provider', '')
-            }
-            demo['github_url'] = _get_url(demo)
-            is_duplicate_demo = any(
-                _demo['url'] == url for _demo in demos
-            )
-            if not is_duplicate_demo:
-                demos.append(demo)
-        demos.sort(key=itemgetter('url'))
-        return demos
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['demos'] = self._get_running_demos()
-        return context
+def disk_usage(request):
+    """Disk used by the demo checkouts, as last measured"""
+    return JsonResponse(get_disk_usage())
+
+
+@require_POST
+def backfill(request):
+    """Start demos for the open PRs of the configured repositories.
+
+    Repositories can be limited with one or more repo parameters, in the
+    format of DEMO_BACKFILL_REPOS.
+    """
+    repos = request.POST.getlist('repo') or settings.DEMO_BACKFILL_REPOS
+    backfill_demos_task.delay(repos=repos)
+    return JsonResponse(
+        {'repos': repos},
+        status=http.HTTPStatus.ACCEPTED,
+    )
 
 
 class DemoStartView(FormView):
@@ -190,6 +233,17 @@ def _validate_webhook_signature(request, remote_signature, webhook_secret):
     return True
 
 
+def _accept_webhook(provider, event, payload, handle):
+    """Spool a webhook for the forwarder, or handle it if that fails"""
+    if settings.DEMO_WEBHOOK_SPOOL:
+        try:
+            spool_webhook(provider, event, payload)
+            return
+        except (sqlite3.Error, OSError) as e:
+            logger.error('Could not spool %s webhook: %s', provider, e)
+    handle(event, payload)
+
+
 @csrf_exempt
 def github_webhook(request):
     """ https://gist.github.com/grantmcconnaughey/6169d8b7a2e770e85c5617bc80ed00a9
@@ -216,7 +270,7 @@ def github_webhook(request):
 
     event = request.META['HTTP_X_GITHUB_EVENT']
 
-    handle_webhook(event, payload)
+    _accept_webhook(GITHUB, event, payload, handle_webhook)
 
     return HttpResponse('Webhook received', status=http.HTTPStatus.ACCEPTED)
 
@@ -248,6 +302,6 @@ def launchpad_webhook(request):
 
     event = request.META['HTTP_X_LAUNCHPAD_EVENT_TYPE']
 
-    handle_launchpad_webhook(event, payload)
+    _accept_webhook(LAUNCHPAD, event, payload, handle_launchpad_webhook)
 
     return HttpResponse('Webhook received', status=http.HTTPStatus.ACCEPTED)
@@ -1,4 +1,6 @@
 #!/usr/bin/env bash
 
 cd app
+# Bring back demos lost in a host or Docker restart before taking new work
+python3 manage.py resume_demos || true
 celery worker -A demoservice.tasks
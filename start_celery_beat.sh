@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+
+cd app
+celery beat -A demoservice.tasks
@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+
+cd app
+python3 manage.py watch_demos
@@ -3,4 +3,5 @@
 cd app
 python3 manage.py migrate
 #python3 manage.py runserver 0.0.0.0:8000
-gunicorn demoservice.wsgi --bind 0.0.0.0:8000
+# Threaded workers, so the dashboard event streams don't block requests
+gunicorn demoservice.wsgi --bind 0.0.0.0:8000 --worker-class gthread --threads 20